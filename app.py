@@ -1,14 +1,25 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
+import atexit
 import os
 import requests
-from datetime import datetime
 from dotenv import load_dotenv
-import gspread
-from google.oauth2.service_account import Credentials
-import openai
 import threading
 import time
-import re
+from job_queue import reply_queue
+from coalesce import event_key, pending_replies, seen_events
+from intents import BIRTHDATE_PATTERN, build_prompt, is_valid_thai_text, route
+import astrology
+from astrology import normalize_birthdate
+import storage
+import backends
+from response_cache import fortune_cache
+from fortune_common import INVITE_TEXT, ask_gpt, birthdate_reading, log_usage, lottery_cache_key
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: ไม่มี file lock ให้ทุก process ping เอง
+    fcntl = None
 
 # === LOAD ENV ===
 load_dotenv()
@@ -16,134 +27,82 @@ app = Flask(__name__)
 
 # === ENV & CONFIG ===
 LINE_ACCESS_TOKEN = os.getenv("LINE_ACCESS_TOKEN")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-GOOGLE_SHEET_ID = os.getenv("GOOGLE_SHEET_ID")
-SHEET_NAME_USERS = os.getenv("SHEET_NAME_USERS")
-SHEET_NAME_LOGS = os.getenv("SHEET_NAME_LOGS")
-PUBLIC_URL = os.getenv("PUBLIC_URL", "http://localhost:5000")
+# ไม่ตั้ง PUBLIC_URL = ไม่ auto-ping (เช่นตอนรันในเครื่อง)
+PUBLIC_URL = os.getenv("PUBLIC_URL")
+AUTO_PING_INTERVAL = float(os.getenv("AUTO_PING_INTERVAL", 300))
+AUTO_PING_LOCK = os.getenv("AUTO_PING_LOCK", "/tmp/dungjit-auto-ping.lock")
 ADMIN_USER = os.getenv("ADMIN_USER", "admin")
 ADMIN_PASS = os.getenv("ADMIN_PASS", "1234")
 
-openai.api_key = OPENAI_API_KEY
-
 # === GOOGLE SHEETS SETUP ===
-SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
-service_account_info = {
-    "type": os.getenv("GOOGLE_TYPE"),
-    "project_id": os.getenv("GOOGLE_PROJECT_ID"),
-    "private_key_id": os.getenv("GOOGLE_PRIVATE_KEY_ID"),
-    "private_key": os.getenv("GOOGLE_PRIVATE_KEY").replace('\\n', '\n'),
-    "client_email": os.getenv("GOOGLE_CLIENT_EMAIL"),
-    "client_id": os.getenv("GOOGLE_CLIENT_ID"),
-    "auth_uri": os.getenv("GOOGLE_AUTH_URI"),
-    "token_uri": os.getenv("GOOGLE_TOKEN_URI"),
-    "auth_provider_x509_cert_url": os.getenv("GOOGLE_AUTH_PROVIDER_X509_CERT_URL"),
-    "client_x509_cert_url": os.getenv("GOOGLE_CLIENT_X509_CERT_URL"),
-}
-creds = Credentials.from_service_account_info(service_account_info, scopes=SCOPES)
-gc = gspread.authorize(creds)
-
-try:
-    users_sheet = gc.open_by_key(GOOGLE_SHEET_ID).worksheet(SHEET_NAME_USERS)
-except Exception as e:
-    users_sheet = None
-    print("❌ ไม่พบ Users Sheet:", e)
+# worksheet จะถูกเปิดตอนใช้งานครั้งแรกใน background thread ไม่ใช่ตอน import
+storage.attach_sheets(backends.users_sheet, backends.logs_sheet)
 
-try:
-    logs_sheet = gc.open_by_key(GOOGLE_SHEET_ID).worksheet(SHEET_NAME_LOGS)
-except Exception as e:
-    logs_sheet = None
-    print("❌ ไม่พบ Logs Sheet:", e)
+metrics.Gauge("dungjit_reply_queue_depth", "Reply jobs waiting for a worker.", lambda: reply_queue.depth)
+metrics.Gauge("dungjit_reply_jobs_active", "Reply jobs currently running.", lambda: reply_queue.active)
+metrics.Gauge("dungjit_pending_reply_users", "Users with a fortune being prepared.", lambda: pending_replies.users)
 
 # === LINE FUNCTIONS ===
-def send_line_message(reply_token, text):
-    headers = {"Authorization": f"Bearer {LINE_ACCESS_TOKEN}", "Content-Type": "application/json"}
-    body = {"replyToken": reply_token, "messages": [{"type": "text", "text": text}]}
-    requests.post("https://api.line.me/v2/bot/message/reply", headers=headers, json=body)
-
-def push_line_message(user_id, text):
-    headers = {"Authorization": f"Bearer {LINE_ACCESS_TOKEN}", "Content-Type": "application/json"}
-    body = {"to": user_id, "messages": [{"type": "text", "text": text}]}
-    requests.post("https://api.line.me/v2/bot/message/push", headers=headers, json=body)
-
-# === ตรวจสอบข้อความไทย ===
-def is_valid_thai_text(text):
-    return bool(re.match(r'^[\u0E00-\u0E7F0-9\s\.,\?!]+$', text))
-    
-# === ตรวจสอบและแปลงวันเกิด ===
-def normalize_birthdate(text):
-    match = re.match(r'^(\d{1,2})[-/](\d{1,2})[-/](\d{2,4})$', text)
-    if match:
-        d, m, y = map(int, match.groups())
-        if y < 100: y += 2500
-        return f"{d:02d}/{m:02d}/{y}"
-    return text
+def send_line_message(reply_token, *texts):
+    backends.line().reply(reply_token, *texts)
+
+def push_line_message(user_id, *texts):
+    backends.line().push(user_id, *texts)
 
 # === AI วิเคราะห์จากวันเกิด ===
 def get_fortune_from_birthdate(birthdate_text):
-    prompt = f"""
-คุณคือหมอดูไทยโบราณ ผู้เชี่ยวชาญในการดูดวงชะตาจากวันเดือนปีเกิดตามหลักโหราศาสตร์ไทย
-
-ผู้ใช้เกิดวันที่: {birthdate_text}
-
-โปรดวิเคราะห์ดวงชะตาโดยละเอียด พร้อมคำแนะนำเสริมดวง เช่น การทำบุญ การสวดมนต์ และข้อคิดให้กำลังใจ โดยใช้ภาษาไทยที่สุภาพ ชัดเจน และเข้าใจง่าย
-"""
+    # วันในสัปดาห์ ปีนักษัตร สี/เลขมงคล คำนวณจากตาราง (astrology.py) ไม่ให้ OpenAI เดาเอง
+    facts = astrology.reading(birthdate_text)
+    if facts and astrology.BIRTHDATE_MODE == "fast":
+        return astrology.fast_answer(facts)
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return response.choices[0].message["content"].strip()
+        # คำตอบขึ้นกับวันเกิดอย่างเดียว จึงใช้ซ้ำได้ทุกคนที่เกิดวันเดียวกัน
+        return fortune_cache.get_or_compute(astrology.cache_key(birthdate_text, facts), lambda: birthdate_reading(birthdate_text, facts))
     except Exception as e:
         return f"⚠️ ข้อผิดพลาดการทำนายวันเกิด: {str(e)}"
 
-# === AI วิเคราะห์ทั่วไป ===
-def get_fortune(message):
-    prompt = f"""
-คุณคือหมอดูไทยโบราณ ผู้เชี่ยวชาญในศาสตร์หลากหลายแขนง เช่น ดวงความรัก การเงิน โชคลาภ การงาน สุขภาพ การทำนายฝัน การเสริมดวง การทำบุญตามแบบไทยโบราณ และการวิเคราะห์เลขเด็ดจากข่าวล่าสุดหลายสำนักทั่วประเทศ
-
-กรุณาวิเคราะห์คำถามของผู้ถามและเลือกใช้ศาสตร์ที่เหมาะสมที่สุดในการให้คำตอบ พร้อมให้คำแนะนำอย่างนุ่มนวล สุภาพ อิงหลักความเชื่อไทย เช่น วันเกิด เลขมงคล บุญกรรม การไหว้พระ และข้อคิดที่ดี
-
-คำถาม: "{message}"
-
-หากคำถามมีการระบุวันเดือนปีเกิด เช่น "17-10-2536", "1/1/2520", หรือรูปแบบอื่นที่คล้ายกัน หรือคำถามเกี่ยวกับ ดวง ดูดวง การเงิน การงาน ความรัก ให้พิจารณาว่าเป็นวันเกิดของผู้ถาม แล้ววิเคราะห์ดวงชะตาตามหลักโหราศาสตร์ไทย เช่น วันเกิด ปีนักษัตร ลัคนา จุดเด่น จุดอ่อน คำเตือน และแนะนำวิธีเสริมดวงตามวันเกิดนั้น ๆ
-
-หากคำถามเกี่ยวกับ "เลขเด็ด", "หวย", หรือ "เลขมงคล", "เลขเด็ดวันนี้" ให้คุณ:
-
-สมมุติว่าคุณเป็นนักข่าวหวยชื่อดัง ที่มีหน้าที่รวบรวมล่าสุดเลขเด็ดเลขดังจากหลายสำนักในประเทศไทย สร้างสรุปข้อมูลของงวดปัจจุบัน (วันที่ 1 หรือ 16 ของเดือนนี้) โดยอ้างอิงจากการรายงานข่าว และแนวโน้มเลขที่ถูกพูดถึง ให้รูปแบบชัดเจน เข้าใจง่าย และเหมาะกับผู้อ่านใน LINE โดยแยกหัวข้อ และใช้ Emoji เพื่อความน่าสนใจ
-
-กรุณาแสดงผลในรูปแบบนี้:
-- 📌 ม้าวิ่ง: แสดงเลขท้าย 2 ตัว และเลขท้าย 3 ตัว งวดล่าสุด
-- 📌 แม่น้ำหนึ่ง: แสดงเลขท้าย 2 ตัว และเลขท้าย 3 ตัว งวดล่าสุด
-- 📌 เพชรกล้า: แสดงเลขเด่น, คู่เลขจับเด่น งวดล่าสุด
-- 📌 เลขธูป (ถ้ามี): แสดงเลขธูป 3 ตัวจากสำนักใดก็ตาม
-- 📌 เลขขันน้ำมนต์: แสดงเลขเด่นที่เห็นจากขันน้ำมนต์ งวดล่าสุด
-- 📌 เลขอั้น / เลขเจ้ามือไม่รับ: ถ้ามีให้ระบุ
-- 📌 เลขที่ออกบ่อยย้อนหลัง 10 งวด: แสดงเลขท้าย 2 ตัว และ 3 ตัว พร้อมสถิติ
-
-หากไม่มีข้อมูลของบางสำนัก ให้ใส่ว่า “ยังไม่พบข้อมูล” แต่ให้จัดรูปแบบให้เหมือนกัน
+# === AI วิเคราะห์ตาม intent (ดู intents.py) ===
+def get_fortune(message, intent=None):
+    intent = intent or route(message)
+    with metrics.timed(f"fortune_{intent}"):
+        if intent == "birthdate":
+            return get_fortune_from_birthdate(normalize_birthdate(BIRTHDATE_PATTERN.search(message).group()))
+        try:
+            if intent == "lottery":
+                key, ttl = lottery_cache_key()
+                return fortune_cache.get_or_compute(key, lambda: ask_gpt(build_prompt("lottery", message)), ttl=ttl)
+            return ask_gpt(build_prompt(intent, message))
+        except Exception as e:
+            return f"⚠️ ระบบหมอดู AI ขัดข้อง: {str(e)}"
 
-สุดท้ายให้ปิดท้ายด้วยคำให้กำลังใจ เช่น:
-“ขอให้โชคดี มีลาภงวดนี้นะครับ 🙏🍀”
+# === REPLY JOB ===
+def reply_later(user_id, message):
+    intent = route(message)
+    reply = get_fortune(message, intent)
+    birthdate = normalize_birthdate(BIRTHDATE_PATTERN.search(message).group()) if intent == "birthdate" else None
 
-ให้ตอบเป็นภาษาไทยทั้งหมด
-"""
+    send_invite = False
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return response.choices[0].message["content"].strip()
+        question_count, invite_sent = storage.record_question(user_id, birthdate)
+        # claim ก่อนส่ง: มีแค่ job เดียวที่ได้ส่งคำเชิญ แม้ข้อความถึงเกณฑ์พร้อมกันหลาย worker
+        send_invite = question_count >= 5 and not invite_sent and storage.claim_invite(user_id)
     except Exception as e:
-        return f"⚠️ ระบบหมอดู AI ขัดข้อง: {str(e)}"
+        print("invite check error:", e)
+
+    # คำเชิญส่งไปพร้อมคำทำนายใน push เดียว
+    push_line_message(user_id, reply, *([INVITE_TEXT] if send_invite else []))
+    log_usage(user_id, "ใช้งานฟรี", f"{message} | intent: {intent}")
 
-# === LOG USAGE ===
-def log_usage(user_id, action, detail):
-    if logs_sheet:
+def reply_pending(user_id):
+    # ข้อความที่ผู้ใช้พิมพ์เพิ่มระหว่างรอคำทำนาย ถูกรวมเป็นคำถามเดียวในรอบถัดไป
+    while True:
+        message = pending_replies.take(user_id)
+        if message is None:
+            return
         try:
-            logs_sheet.append_row([datetime.now().isoformat(), user_id, action, detail])
+            reply_later(user_id, message)
         except Exception as e:
-            print("Log error:", e)
+            print("❌ reply job error:", e)
 
 # === WEBHOOK ===
 @app.route("/webhook", methods=["POST"])
@@ -156,50 +115,39 @@ def webhook():
         if event["type"] != "message":
             continue
 
+        # LINE ส่ง event เดิมซ้ำเมื่อ webhook ตอบช้า
+        key = event_key(event)
+        if key and seen_events.check_and_add(key):
+            metrics.WEBHOOK_EVENTS.inc(result="duplicate")
+            continue
+
         reply_token = event["replyToken"]
         user_id = event["source"]["userId"]
         message = event["message"].get("text", "").strip()
 
         if not message:
+            metrics.WEBHOOK_EVENTS.inc(result="empty")
             send_line_message(reply_token, "📌 กรุณาพิมพ์ข้อความเป็นภาษาไทย หรือระบุวันเกิด")
             continue
 
-        if not is_valid_thai_text(message) and not re.search(r'\d{1,2}[-/]\d{1,2}[-/]\d{2,4}', message):
+        if not is_valid_thai_text(message) and not BIRTHDATE_PATTERN.search(message):
+            metrics.WEBHOOK_EVENTS.inc(result="invalid")
             send_line_message(reply_token, "📌 โปรดพิมพ์ข้อความเป็นภาษาไทย หรือระบุวันเกิด")
             continue
 
-        send_line_message(reply_token, "🧘‍♀️ หมอดูกำลัง วิเคราะห์ และทำนาย กรุณารอสักครู่...")
+        # มีคำทำนายของ user นี้ค้างอยู่แล้ว: ข้อความนี้จะถูกรวมไปในรอบถัดไป ไม่ต้องตอบ "รอสักครู่" ซ้ำ
+        if not pending_replies.add(user_id, message):
+            metrics.WEBHOOK_EVENTS.inc(result="coalesced")
+            continue
+
+        if not reply_queue.submit(reply_pending, user_id):
+            pending_replies.cancel(user_id)
+            metrics.WEBHOOK_EVENTS.inc(result="shed")
+            send_line_message(reply_token, "🙏 ขณะนี้มีผู้ใช้งานจำนวนมาก กรุณาส่งคำถามอีกครั้งในอีกสักครู่")
+            continue
 
-        def reply_later():
-            match = re.search(r'\d{1,2}[-/]\d{1,2}[-/]\d{2,4}', message)
-            reply = get_fortune_from_birthdate(normalize_birthdate(match.group())) if match else get_fortune(message)
-            push_line_message(user_id, reply)
-            log_usage(user_id, "ใช้งานฟรี", message)
-
-            try:
-                records = users_sheet.get_all_records()
-                for i, row in enumerate(records, start=2):
-                    if row["user_id"] == user_id:
-                        question_count = int(row.get("question_count", 0)) + 1
-                        invite_sent = str(row.get("invite_sent", "")).lower().strip()
-
-                        users_sheet.update_cell(i, 4, question_count)
-
-                        if question_count >= 5 and invite_sent != "true":
-                            text = (
-                                "📢 ขอบคุณที่ใช้งาน ดวงจิตหมอดู AI บ่อย!\n"
-                                "เพื่อสนับสนุนเรา ขอเชิญคุณช่วยแชร์ลิงก์เพิ่มเพื่อนให้เพื่อนของคุณ "
-                                "เพิ่มเพื่อนที่นี่เลย 👉 https://lin.ee/7LgReP1"
-                            )
-                            push_line_message(user_id, text)
-                            users_sheet.update_cell(i, 5, "TRUE")
-                        break
-                else:
-                    users_sheet.append_row([user_id, "", "", 1, ""])
-            except Exception as e:
-                print("invite check error:", e)
-
-        threading.Thread(target=reply_later).start()
+        metrics.WEBHOOK_EVENTS.inc(result="accepted")
+        send_line_message(reply_token, "🧘‍♀️ หมอดูกำลัง วิเคราะห์ และทำนาย กรุณารอสักครู่...")
 
     return jsonify({"status": "ok"})
 
@@ -208,6 +156,11 @@ def webhook():
 def healthz():
     return "OK", 200
 
+# === METRICS (Prometheus) ===
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
 # === AUTO PING ===
 def auto_ping():
     while True:
@@ -216,9 +169,39 @@ def auto_ping():
             print("🔁 Auto-ping sent")
         except Exception as e:
             print("⚠️ Auto-ping error:", e)
-        time.sleep(300)
-
-threading.Thread(target=auto_ping, daemon=True).start()
+        time.sleep(AUTO_PING_INTERVAL)
+
+_ping_lock = None
+
+def start_auto_ping():
+    # gunicorn มีหลาย worker แต่ต้องการ ping แค่ตัวเดียว: ใครได้ lock ไฟล์ก่อนเป็นคน ping
+    # lock ถูกปล่อยเองเมื่อ process ตาย แล้ว worker ตัวใหม่ที่ import ทีหลังจะรับช่วงแทน
+    global _ping_lock
+    if not PUBLIC_URL or _ping_lock is not None:
+        return False
+    if fcntl is not None:
+        lock = open(AUTO_PING_LOCK, "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return False
+        _ping_lock = lock
+    else:
+        _ping_lock = True
+    threading.Thread(target=auto_ping, name="auto-ping", daemon=True).start()
+    return True
+
+start_auto_ping()
+
+# === SHUTDOWN ===
+def shutdown():
+    # hook เดียวเพื่อคุมลำดับ: งานที่ค้างในคิวยังนับคำถาม/เขียน log อยู่ จึงต้องรอคิวให้หมดก่อน
+    # แล้วค่อยส่ง Users/Logs ที่ค้างลง Sheets
+    reply_queue.shutdown()
+    storage.close()
+
+atexit.register(shutdown)
 
 # === START ===
 if __name__ == "__main__":
@@ -0,0 +1,245 @@
+# asgi_app.py — โหมด asyncio สำหรับ /webhook และ /healthz
+# รัน: gunicorn asgi_app:application -k uvicorn.workers.UvicornWorker
+#  หรือ uvicorn asgi_app:application --host 0.0.0.0 --port $PORT
+#
+# พฤติกรรมเหมือน app.py: ตอบ "กรุณารอสักครู่" ทันที แล้ว push คำทำนายตามมา
+# ต่างกันที่งานรอ I/O (OpenAI, LINE, SQLite/Sheets) ไม่กิน OS thread ต่อคำถาม
+import asyncio
+import json
+import os
+
+import backends
+from coalesce import event_key, pending_replies, seen_events
+import storage
+import astrology
+from fortune_common import FORTUNE_TIMEOUT, INVITE_TEXT, log_usage, lottery_cache_key
+from astrology import normalize_birthdate
+from intents import BIRTHDATE_PATTERN, build_prompt, is_valid_thai_text, route
+import metrics
+from line_client import AsyncLineClient
+from response_cache import fortune_cache
+
+# === CONFIG ===
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", 50))
+LINE_CONCURRENCY = int(os.getenv("LINE_CONCURRENCY", 100))
+STORAGE_CONCURRENCY = int(os.getenv("STORAGE_CONCURRENCY", 8))
+REPLY_JOB_TIMEOUT = float(os.getenv("REPLY_JOB_TIMEOUT", 150))
+DRAIN_TIMEOUT = float(os.getenv("REPLY_DRAIN_TIMEOUT", 30))
+
+# สร้างตอน lifespan startup เพื่อให้ผูกกับ event loop ของ worker
+_line = None
+_openai_limit = None
+_line_limit = None
+_storage_limit = None
+_pending = set()
+
+metrics.Gauge("dungjit_async_reply_jobs_active", "Reply tasks in flight on the event loop.", lambda: len(_pending))
+
+
+# === UPSTREAM CALLS ===
+async def ask_gpt(prompt):
+    # เวลารอคิว _openai_limit นับรวมใน FORTUNE_TIMEOUT ด้วย
+    return await asyncio.wait_for(_ask_gpt(prompt), FORTUNE_TIMEOUT)
+
+
+async def _ask_gpt(prompt):
+    async with _openai_limit:
+        with metrics.timed("openai"):
+            response = await backends.openai_client().ChatCompletion.acreate(
+                model="gpt-4o",
+                messages=[{"role": "user", "content": prompt}]
+            )
+    return response.choices[0].message["content"].strip()
+
+
+async def run_storage(fn, *args):
+    async with _storage_limit:
+        return await asyncio.to_thread(fn, *args)
+
+
+async def send_line_message(reply_token, *texts):
+    async with _line_limit:
+        await _line.reply(reply_token, *texts)
+
+
+async def push_line_message(user_id, *texts):
+    async with _line_limit:
+        await _line.push(user_id, *texts)
+
+
+# === FORTUNE ===
+async def get_fortune_from_birthdate(birthdate_text):
+    facts = astrology.reading(birthdate_text)
+    if facts and astrology.BIRTHDATE_MODE == "fast":
+        return astrology.fast_answer(facts)
+    try:
+        return await fortune_cache.get_or_compute_async(
+            astrology.cache_key(birthdate_text, facts), lambda: ask_gpt(build_prompt("birthdate", birthdate_text, facts))
+        )
+    except Exception as e:
+        return f"⚠️ ข้อผิดพลาดการทำนายวันเกิด: {str(e) or type(e).__name__}"
+
+
+async def get_fortune(message, intent):
+    with metrics.timed(f"fortune_{intent}"):
+        if intent == "birthdate":
+            return await get_fortune_from_birthdate(normalize_birthdate(BIRTHDATE_PATTERN.search(message).group()))
+        try:
+            if intent == "lottery":
+                key, ttl = lottery_cache_key()
+                return await fortune_cache.get_or_compute_async(
+                    key, lambda: ask_gpt(build_prompt("lottery", message)), ttl=ttl
+                )
+            return await ask_gpt(build_prompt(intent, message))
+        except Exception as e:
+            return f"⚠️ ระบบหมอดู AI ขัดข้อง: {str(e) or type(e).__name__}"
+
+
+async def reply_later(user_id, message):
+    intent = route(message)
+    reply = await get_fortune(message, intent)
+    birthdate = normalize_birthdate(BIRTHDATE_PATTERN.search(message).group()) if intent == "birthdate" else None
+
+    send_invite = False
+    try:
+        question_count, invite_sent = await run_storage(storage.record_question, user_id, birthdate)
+        # claim ก่อนส่ง: มีแค่ job เดียวที่ได้ส่งคำเชิญ แม้ข้อความถึงเกณฑ์พร้อมกันหลาย worker
+        send_invite = question_count >= 5 and not invite_sent and await run_storage(storage.claim_invite, user_id)
+    except Exception as e:
+        print("invite check error:", e)
+
+    await push_line_message(user_id, reply, *([INVITE_TEXT] if send_invite else []))
+    await run_storage(log_usage, user_id, "ใช้งานฟรี", f"{message} | intent: {intent}")
+
+
+async def _run_reply_job(user_id):
+    # ข้อความที่เข้ามาระหว่างรอคำทำนาย ถูกรวมเป็นคำถามเดียวในรอบถัดไป (ดู coalesce.Coalescer)
+    try:
+        while True:
+            message = pending_replies.take(user_id)
+            if message is None:
+                return
+            try:
+                await asyncio.wait_for(reply_later(user_id, message), REPLY_JOB_TIMEOUT)
+            except Exception as e:
+                print("❌ reply job error:", repr(e))
+    finally:
+        # task จบด้วยเหตุใดก็ตาม (รวมถึงถูกยกเลิก) ต้องปล่อย user ไม่เช่นนั้นข้อความถัดไปจะค้างรอตลอดไป
+        pending_replies.cancel(user_id)
+
+
+# === WEBHOOK ===
+async def webhook(body):
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return 400, {"status": "error", "message": "Content-Type must be application/json"}
+
+    for event in data.get("events", []):
+        if event["type"] != "message":
+            continue
+
+        key = event_key(event)
+        if key and seen_events.check_and_add(key):
+            metrics.WEBHOOK_EVENTS.inc(result="duplicate")
+            continue
+
+        reply_token = event["replyToken"]
+        user_id = event["source"]["userId"]
+        message = event["message"].get("text", "").strip()
+
+        if not message:
+            metrics.WEBHOOK_EVENTS.inc(result="empty")
+            await send_line_message(reply_token, "📌 กรุณาพิมพ์ข้อความเป็นภาษาไทย หรือระบุวันเกิด")
+            continue
+
+        if not is_valid_thai_text(message) and not BIRTHDATE_PATTERN.search(message):
+            metrics.WEBHOOK_EVENTS.inc(result="invalid")
+            await send_line_message(reply_token, "📌 โปรดพิมพ์ข้อความเป็นภาษาไทย หรือระบุวันเกิด")
+            continue
+
+        if not pending_replies.add(user_id, message):
+            metrics.WEBHOOK_EVENTS.inc(result="coalesced")
+            continue
+
+        metrics.WEBHOOK_EVENTS.inc(result="accepted")
+        await send_line_message(reply_token, "🧘‍♀️ หมอดูกำลัง วิเคราะห์ และทำนาย กรุณารอสักครู่...")
+
+        task = asyncio.create_task(_run_reply_job(user_id))
+        _pending.add(task)
+        task.add_done_callback(_pending.discard)
+
+    return 200, {"status": "ok"}
+
+
+# === ASGI PLUMBING ===
+async def _startup():
+    global _line, _openai_limit, _line_limit, _storage_limit
+    # worksheet จะถูกเปิดตอนใช้งานครั้งแรกใน background thread ไม่ใช่ตอน startup
+    storage.attach_sheets(backends.users_sheet, backends.logs_sheet)
+    _line = AsyncLineClient(os.getenv("LINE_ACCESS_TOKEN"))
+    _openai_limit = asyncio.Semaphore(OPENAI_CONCURRENCY)
+    _line_limit = asyncio.Semaphore(LINE_CONCURRENCY)
+    _storage_limit = asyncio.Semaphore(STORAGE_CONCURRENCY)
+
+
+async def _shutdown():
+    # รอให้คำทำนายที่ค้างอยู่ถูกส่งก่อนปิด worker
+    if _pending:
+        await asyncio.wait(set(_pending), timeout=DRAIN_TIMEOUT)
+    await _line.aclose()
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        event = await receive()
+        chunks.append(event.get("body", b""))
+        if not event.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _respond(send, status, body, content_type="application/json"):
+    if not isinstance(body, (bytes, str)):
+        body = json.dumps(body, ensure_ascii=False)
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            event = await receive()
+            if event["type"] == "lifespan.startup":
+                await _startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif event["type"] == "lifespan.shutdown":
+                await _shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    if scope["type"] != "http":
+        return
+
+    path, method = scope["path"], scope["method"]
+    if path == "/healthz":
+        await _respond(send, 200, "OK", "text/plain")
+    elif path == "/metrics":
+        await _respond(send, 200, metrics.render(), metrics.CONTENT_TYPE)
+    elif path == "/webhook" and method == "POST":
+        headers = dict(scope["headers"])
+        if not headers.get(b"content-type", b"").startswith(b"application/json"):
+            await _respond(send, 400, {"status": "error", "message": "Content-Type must be application/json"})
+            return
+        status, payload = await webhook(await _read_body(receive))
+        await _respond(send, status, payload)
+    elif path == "/webhook":
+        await _respond(send, 405, "Method Not Allowed", "text/plain")
+    else:
+        await _respond(send, 404, "Not Found", "text/plain")
@@ -0,0 +1,187 @@
+# astrology.py — ข้อเท็จจริงตายตัวของวันเกิด (วันในสัปดาห์, พ.ศ./ค.ศ., ปีนักษัตร, สี/เลขมงคล)
+# คำนวณจากตาราง ไม่ต้องให้ OpenAI คิดเอง ทำทีละหลายคนได้ด้วย numpy
+#
+# เติม cache คำทำนายวันเกิดล่วงหน้าให้ผู้ใช้ทุกคนที่เคยส่งวันเกิด:
+#   python astrology.py
+import os
+import re
+
+import numpy as np
+
+# === CONFIG ===
+# "llm" = ส่งข้อเท็จจริงที่คำนวณแล้วไปกับ prompt, "fast" = ตอบจาก template ทันทีโดยไม่เรียก OpenAI
+BIRTHDATE_MODE = os.getenv("BIRTHDATE_MODE", "llm").lower()
+BE_OFFSET = 543
+# ปีนักษัตรเปลี่ยนที่วันเถลิงศก (16 เมษายน) ไม่ใช่ 1 มกราคม
+ZODIAC_NEW_YEAR = (4, 16)
+
+# === TABLES (index 0 = วันอาทิตย์) ===
+WEEKDAYS = ["อาทิตย์", "จันทร์", "อังคาร", "พุธ", "พฤหัสบดี", "ศุกร์", "เสาร์"]
+BIRTH_COLOURS = ["แดง", "เหลือง", "ชมพู", "เขียว", "ส้ม", "ฟ้า", "ม่วง"]
+LUCKY_COLOURS = [
+    ["แดง", "เขียว"],
+    ["เหลือง", "ขาว"],
+    ["ชมพู", "ม่วง"],
+    ["เขียว", "เหลือง"],
+    ["ส้ม", "ฟ้า"],
+    ["ฟ้า", "ชมพู"],
+    ["ม่วง", "ดำ"],
+]
+WEEKDAY_TRAITS = [
+    "มีความเป็นผู้นำ มั่นใจในตัวเอง รักศักดิ์ศรี",
+    "อ่อนโยน มีเสน่ห์ จิตใจเมตตา",
+    "กล้าหาญ ขยันขันแข็ง ใจร้อนเล็กน้อย",
+    "ช่างพูด ฉลาด มีไหวพริบดี",
+    "รักความรู้ มีหลักการ เป็นที่เคารพของคนรอบข้าง",
+    "รักสวยรักงาม มีอารมณ์ศิลปิน เข้ากับคนง่าย",
+    "อดทน หนักแน่น สู้ชีวิต",
+]
+# ปีนักษัตร index 0 = ชวด (ค.ศ. 2020 เป็นปีชวด)
+ZODIAC = ["ชวด", "ฉลู", "ขาล", "เถาะ", "มะโรง", "มะเส็ง", "มะเมีย", "มะแม", "วอก", "ระกา", "จอ", "กุน"]
+ZODIAC_ANIMALS = ["หนู", "วัว", "เสือ", "กระต่าย", "งูใหญ่", "งูเล็ก", "ม้า", "แพะ", "ลิง", "ไก่", "สุนัข", "หมู"]
+
+_BIRTHDATE = re.compile(r'^(\d{1,2})[-/](\d{1,2})[-/](\d{2,4})$')
+
+
+def normalize_birthdate(text):
+    match = _BIRTHDATE.match(text)
+    if match:
+        d, m, y = map(int, match.groups())
+        if y < 100: y += 2500
+        return f"{d:02d}/{m:02d}/{y}"
+    return text
+
+
+def _parse(texts):
+    days, months, years = [], [], []
+    for text in texts:
+        match = _BIRTHDATE.match(normalize_birthdate(text))
+        d, m, y = map(int, match.groups()) if match else (0, 0, 0)
+        days.append(d)
+        months.append(m)
+        years.append(y)
+    return np.array(days), np.array(months), np.array(years)
+
+
+def _digit_sum(values):
+    total = np.zeros_like(values)
+    while values.any():
+        total += values % 10
+        values = values // 10
+    return total
+
+
+def compute_many(texts):
+    """Birthdate facts for many ``dd/mm/yyyy`` strings in one vectorised pass.
+
+    Years >= 2400 are read as พ.ศ., anything else as ค.ศ. Returns a list of
+    dicts aligned with ``texts``; unparseable or impossible dates give None.
+    """
+    days, months, years = _parse(texts)
+    be = np.where(years >= 2400, years, years + BE_OFFSET)
+    ce = be - BE_OFFSET
+
+    # วันที่ไม่มีจริง (เช่น 31/02) จะล้นไปเดือนถัดไป จึงเทียบเดือนกลับเพื่อตรวจ
+    safe_months = np.clip(months, 1, 12)
+    month_start = (ce - 1970).astype("datetime64[Y]") + (safe_months - 1).astype("timedelta64[M]")
+    dates = month_start + (np.clip(days, 1, 31) - 1).astype("timedelta64[D]")
+    valid = (years > 0) & (days >= 1) & (days <= 31) & (months == safe_months) & (dates.astype("datetime64[M]") == month_start)
+
+    # 1970-01-01 เป็นวันพฤหัสบดี (index 4)
+    weekday = (dates.astype(np.int64) + 4) % 7
+    before_new_year = (months < ZODIAC_NEW_YEAR[0]) | ((months == ZODIAC_NEW_YEAR[0]) & (days < ZODIAC_NEW_YEAR[1]))
+    zodiac = (ce - before_new_year - 2020) % 12
+    # เลขผลรวมวันเกิด (วัน + เดือน + ปี พ.ศ.) ทอนเหลือหลักเดียว
+    life_number = (_digit_sum(days) + _digit_sum(months) + _digit_sum(be) - 1) % 9 + 1
+
+    results = []
+    for i, text in enumerate(texts):
+        if not valid[i]:
+            results.append(None)
+            continue
+        w = int(weekday[i])
+        lucky_numbers = sorted({w + 1, int(life_number[i])})
+        results.append({
+            "birthdate": f"{days[i]:02d}/{months[i]:02d}/{be[i]}",
+            "year_be": int(be[i]),
+            "year_ce": int(ce[i]),
+            "weekday": WEEKDAYS[w],
+            "zodiac": ZODIAC[zodiac[i]],
+            "zodiac_animal": ZODIAC_ANIMALS[zodiac[i]],
+            "birth_colour": BIRTH_COLOURS[w],
+            "lucky_colours": LUCKY_COLOURS[w],
+            "lucky_numbers": lucky_numbers,
+            "traits": WEEKDAY_TRAITS[w],
+        })
+    return results
+
+
+def reading(birthdate_text):
+    return compute_many([birthdate_text])[0]
+
+
+def cache_key(birthdate_text, facts=None):
+    # ใช้วันเกิดแบบ พ.ศ. จาก facts เป็น key: 17/10/1993 กับ 17/10/2536 ได้คำทำนายเดียวกัน
+    return f"birthdate:{facts['birthdate'] if facts else birthdate_text}"
+
+
+# === OUTPUT ===
+def format_context(facts):
+    # บรรทัดสั้น ๆ สำหรับแนบใน prompt ให้ OpenAI ใช้ตามนี้แทนการคำนวณเอง
+    return (
+        f"เกิดวัน{facts['weekday']} | พ.ศ. {facts['year_be']} (ค.ศ. {facts['year_ce']}) | "
+        f"ปี{facts['zodiac']} ({facts['zodiac_animal']}) | สีประจำวันเกิด: {facts['birth_colour']} | "
+        f"สีมงคล: {', '.join(facts['lucky_colours'])} | เลขมงคล: {', '.join(map(str, facts['lucky_numbers']))}"
+    )
+
+
+def fast_answer(facts):
+    return (
+        f"🔮 ดวงชะตาผู้เกิดวันที่ {facts['birthdate']}\n"
+        f"📅 เกิดวัน{facts['weekday']} ปี{facts['zodiac']} ({facts['zodiac_animal']}) "
+        f"พ.ศ. {facts['year_be']} / ค.ศ. {facts['year_ce']}\n"
+        f"✨ นิสัยตามวันเกิด: {facts['traits']}\n"
+        f"🎨 สีประจำวันเกิด: {facts['birth_colour']} | สีมงคล: {', '.join(facts['lucky_colours'])}\n"
+        f"🔢 เลขมงคล: {', '.join(map(str, facts['lucky_numbers']))}\n"
+        f"🙏 เสริมดวงด้วยการทำบุญตักบาตรในวัน{facts['weekday']} และสวดมนต์ก่อนนอน"
+    )
+
+
+# === PRECOMPUTE ===
+def precompute(birthdates, answer):
+    """Fill the fortune cache for every distinct valid birthdate not cached yet.
+
+    ``answer(birthdate_text, facts)`` produces the reading; facts for the whole
+    list are computed up front in a single vectorised pass.
+    """
+    from response_cache import fortune_cache
+
+    texts = sorted({normalize_birthdate(b) for b in birthdates if b})
+    filled = 0
+    for text, facts in zip(texts, compute_many(texts)):
+        if facts is None:
+            continue
+        key = cache_key(text, facts)
+        if fortune_cache.get(key) is not None:
+            continue
+        fortune_cache.set(key, answer(text, facts))
+        filled += 1
+    return filled
+
+
+def known_birthdates():
+    from db_setup import SessionLocal, User
+
+    with SessionLocal() as session:
+        return [b for (b,) in session.query(User.birthdate).filter(User.birthdate.isnot(None))]
+
+
+if __name__ == "__main__":
+    from fortune_common import birthdate_reading
+    from response_cache import fortune_cache
+
+    if BIRTHDATE_MODE == "fast":
+        raise SystemExit("BIRTHDATE_MODE=fast ตอบจาก template อยู่แล้ว ไม่ต้องเตรียมล่วงหน้า")
+    if not fortune_cache.persist:
+        raise SystemExit("FORTUNE_CACHE_PERSIST ไม่ได้เปิด ผลที่คำนวณจะหายไปเมื่อจบ process นี้ (เปิดก่อนแล้วค่อยรันใหม่)")
+    print(f"✅ เตรียมคำทำนายวันเกิดล่วงหน้า {precompute(known_birthdates(), birthdate_reading)} วัน")
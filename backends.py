@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+
+import openai
+from dotenv import load_dotenv
+
+import sheets_client
+from line_client import LineClient
+
+load_dotenv()
+
+# === CONFIG ===
+GOOGLE_SHEET_ID = os.getenv("GOOGLE_SHEET_ID")
+SHEET_NAME_USERS = os.getenv("SHEET_NAME_USERS")
+SHEET_NAME_LOGS = os.getenv("SHEET_NAME_LOGS")
+# หลังเชื่อมต่อไม่สำเร็จ รอเท่านี้ก่อนลองใหม่ (กันยิง Google ถี่ ๆ ตอน Sheets ล่ม)
+BACKEND_RETRY_INTERVAL = float(os.getenv("BACKEND_RETRY_INTERVAL", 30))
+
+# ที่เก็บ client ที่สร้างแล้วของ process นี้ สร้างครั้งแรกตอนถูกใช้จริง ไม่ใช่ตอน import
+# เก็บ pid ไว้ด้วย: process ที่ fork ออกไป (เช่น Celery prefork) จะสร้างของตัวเองใหม่
+# ไม่รองรับ gunicorn --preload: app.py / storage เริ่ม thread (reply_queue, sheet mirror, log writer)
+# ตอน import ซึ่งจะไม่ติดไปกับ worker ที่ fork ออกไป
+_handles = {}
+_failures = {}
+_name_locks = {}
+_pid = os.getpid()
+_lock = threading.Lock()  # ป้องกันเฉพาะ dict ข้างบน ไม่ถือไว้ระหว่างเชื่อมต่อ
+
+
+def _get(name, factory):
+    global _pid
+    with _lock:
+        if _pid != os.getpid():
+            _handles.clear()
+            _failures.clear()
+            _name_locks.clear()
+            _pid = os.getpid()
+        if name in _handles:
+            return _handles[name]
+        name_lock = _name_locks.setdefault(name, threading.Lock())
+
+    # สร้างทีละชื่อ: line() ไม่ต้องรอ Sheets ที่กำลังเชื่อมต่อ (หรือค้าง) อยู่
+    with name_lock:
+        with _lock:
+            if name in _handles:
+                return _handles[name]
+            failed_at, error = _failures.get(name, (0, None))
+        if time.time() - failed_at < BACKEND_RETRY_INTERVAL:
+            raise error
+        try:
+            handle = factory()
+        except Exception as e:
+            with _lock:
+                _failures[name] = (time.time(), e)
+            raise
+        with _lock:
+            _failures.pop(name, None)
+            _handles[name] = handle
+        return handle
+
+
+# === GOOGLE SHEETS ===
+def sheets():
+    return _get("sheets", sheets_client.authorize)
+
+
+def spreadsheet():
+    # open_by_key ครั้งเดียวต่อ process แล้วใช้ร่วมกันทุก worksheet
+    return _get("spreadsheet", lambda: sheets().open_by_key(GOOGLE_SHEET_ID))
+
+
+def worksheet(title):
+    return _get(f"worksheet:{title}", lambda: spreadsheet().worksheet(title))
+
+
+class LazyWorksheet:
+    """Stands in for a gspread worksheet and opens it on first use.
+
+    UserStore and BufferedLogWriter only touch the sheet from their background
+    threads, so handing them this proxy keeps Google off the import path.
+    """
+
+    def __init__(self, title):
+        self.title = title
+
+    def __getattr__(self, name):
+        return getattr(worksheet(self.title), name)
+
+    def __repr__(self):
+        return f"<LazyWorksheet {self.title!r}>"
+
+
+users_sheet = LazyWorksheet(SHEET_NAME_USERS) if GOOGLE_SHEET_ID and SHEET_NAME_USERS else None
+logs_sheet = LazyWorksheet(SHEET_NAME_LOGS) if GOOGLE_SHEET_ID and SHEET_NAME_LOGS else None
+
+
+# === LINE ===
+def line():
+    return _get("line", lambda: LineClient(os.getenv("LINE_ACCESS_TOKEN")))
+
+
+# === OPENAI ===
+def _openai():
+    openai.api_key = os.getenv("OPENAI_API_KEY")
+    return openai
+
+
+def openai_client():
+    return _get("openai", _openai)
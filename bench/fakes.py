@@ -0,0 +1,219 @@
+# เซิร์ฟเวอร์จำลอง LINE / OpenAI / Google Sheets สำหรับวัดผลแบบ offline
+# ทุกตัวรันใน thread ของ process เดียวกับ benchmark และนับจำนวน call ไว้ให้
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+
+class FakeServer:
+    def __init__(self):
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _dispatch(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+                status, payload = server.handle(method, urlparse(self.path).path, body)
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def do_PUT(self):
+                self._dispatch("PUT")
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def count(self, name):
+        with self._lock:
+            self.calls[name] += 1
+
+    def handle(self, method, path, body):
+        raise NotImplementedError
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# === LINE Messaging API ===
+class FakeLine(FakeServer):
+    """Records every reply/push with its arrival time. Also answers /healthz
+    so PUBLIC_URL can point here for the auto-ping thread."""
+
+    def __init__(self):
+        self.replies = []
+        self.pushes = []
+        super().__init__()
+
+    def handle(self, method, path, body):
+        now = time.perf_counter()
+        if path.endswith("/message/reply"):
+            self.count("line.reply")
+            with self._lock:
+                self.replies.append((now, body["replyToken"], body["messages"]))
+        elif path.endswith("/message/push"):
+            self.count("line.push")
+            with self._lock:
+                self.pushes.append((now, body["to"], body["messages"]))
+        elif path.endswith("/message/multicast"):
+            self.count("line.multicast")
+        elif path.endswith("/message/broadcast"):
+            self.count("line.broadcast")
+        elif path == "/healthz":
+            self.count("ping")
+        else:
+            return 404, {"message": "not found"}
+        return 200, {}
+
+
+# === OpenAI chat completions ===
+class FakeOpenAI(FakeServer):
+    def __init__(self, latency=1.5, jitter=0.5):
+        self.latency = latency
+        self.jitter = jitter
+        self.prompt_chars = 0
+        super().__init__()
+
+    def handle(self, method, path, body):
+        if not path.endswith("/chat/completions"):
+            return 404, {"error": {"message": "not found"}}
+        self.count("openai.chat")
+        prompt = "".join(m.get("content", "") for m in body.get("messages", []))
+        with self._lock:
+            self.prompt_chars += len(prompt)
+        time.sleep(max(0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        return 200, {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "🔮 ดวงของคุณช่วงนี้ดีมาก (คำตอบจำลอง)"},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": len(prompt) // 3, "completion_tokens": 20, "total_tokens": len(prompt) // 3 + 20},
+        }
+
+
+# === Google Sheets API v4 (เฉพาะ endpoint ที่ gspread ใช้ในแอปนี้) ===
+_A1 = re.compile(r"^([A-Z]*)(\d*)$")
+
+
+def _col_index(letters):
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch) - 64
+    return n
+
+
+def _parse_range(rng):
+    # "'Users'!B2:F" -> ("Users", row0, col0, row1, col1)  (1-based, None = เปิดท้าย)
+    title, _, cells = rng.partition("!")
+    title = title.strip("'")
+    if not cells:
+        return title, 1, 1, None, None
+    start, _, end = cells.partition(":")
+    c0, r0 = _A1.match(start).groups()
+    c1, r1 = _A1.match(end or start).groups()
+    return (title, int(r0 or 1), _col_index(c0) if c0 else 1,
+            int(r1) if r1 else None, _col_index(c1) if c1 else None)
+
+
+class FakeSheets(FakeServer):
+    def __init__(self, sheets, latency=0.3):
+        # sheets: {"Users": [[header...], ...], "Logs": [[header...]]}
+        self.sheets = sheets
+        self.latency = latency
+        super().__init__()
+
+    def handle(self, method, path, body):
+        time.sleep(self.latency)
+        match = re.match(r"^/v4/spreadsheets/([^/:]+)(.*)$", path)
+        if not match:
+            return 404, {"error": {"message": "not found"}}
+        spreadsheet_id, rest = match.groups()
+        rest = unquote(rest)
+        with self._lock:
+            if rest == "" and method == "GET":
+                self.calls["sheets.metadata"] += 1
+                return 200, self._metadata(spreadsheet_id)
+            if rest.startswith("/values/") and rest.endswith(":append"):
+                self.calls["sheets.append"] += 1
+                return 200, self._append(spreadsheet_id, rest[len("/values/"):-len(":append")], body)
+            if rest.startswith("/values/") and method == "GET":
+                self.calls["sheets.get"] += 1
+                return 200, self._get(rest[len("/values/"):])
+            if rest == "/values:batchUpdate":
+                self.calls["sheets.batch_update"] += 1
+                for item in body.get("data", []):
+                    self._write(item["range"], item["values"])
+                return 200, {"spreadsheetId": spreadsheet_id}
+            if rest.startswith("/values/") and method == "PUT":
+                self.calls["sheets.update"] += 1
+                self._write(rest[len("/values/"):], body.get("values", []))
+                return 200, {"spreadsheetId": spreadsheet_id}
+        return 404, {"error": {"message": f"unsupported {method} {rest}"}}
+
+    def _metadata(self, spreadsheet_id):
+        return {
+            "spreadsheetId": spreadsheet_id,
+            "properties": {"title": "bench", "locale": "th_TH", "timeZone": "Asia/Bangkok"},
+            "sheets": [
+                {"properties": {"sheetId": i, "title": title, "index": i, "sheetType": "GRID",
+                                "gridProperties": {"rowCount": 100000, "columnCount": 26}}}
+                for i, title in enumerate(self.sheets)
+            ],
+        }
+
+    def _get(self, rng):
+        title, r0, c0, r1, c1 = _parse_range(rng)
+        rows = self.sheets[title][r0 - 1:r1]
+        values = [row[c0 - 1:c1] for row in rows]
+        return {"range": rng, "majorDimension": "ROWS", "values": values}
+
+    def _append(self, spreadsheet_id, rng, body):
+        title = _parse_range(rng)[0]
+        sheet = self.sheets[title]
+        start = len(sheet) + 1
+        sheet.extend([[str(v) for v in row] for row in body.get("values", [])])
+        return {
+            "spreadsheetId": spreadsheet_id,
+            "updates": {"updatedRange": f"'{title}'!A{start}:Z{len(sheet)}", "updatedRows": len(sheet) - start + 1},
+        }
+
+    def _write(self, rng, values):
+        title, r0, c0, _, _ = _parse_range(rng)
+        sheet = self.sheets[title]
+        for dr, row in enumerate(values):
+            while len(sheet) < r0 + dr:
+                sheet.append([])
+            target = sheet[r0 + dr - 1]
+            for dc, value in enumerate(row):
+                while len(target) < c0 + dc:
+                    target.append("")
+                target[c0 + dc - 1] = str(value)
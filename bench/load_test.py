@@ -0,0 +1,245 @@
+# Load test แบบ offline: ยิง webhook event เข้า app.py (หรือ asgi_app.py) ที่ต่อกับ LINE / OpenAI / Sheets จำลอง
+#
+#   python -m bench.load_test --events 300 --rate 30
+#   python -m bench.load_test --scenario draw-day --events 1000 --rate 200 --openai-latency 3
+#   python -m bench.load_test --server asgi
+#
+# รายงาน: throughput, latency webhook -> push (p50/p95/p99), จำนวนข้อความที่ถูกรวม,
+# จำนวน thread / หน่วยความจำสูงสุด และจำนวน call ไปยังแต่ละ upstream
+import argparse
+import bisect
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.fakes import FakeLine, FakeOpenAI, FakeSheets  # noqa: E402
+
+USERS_HEADER = ["user_id", "name", "usage", "paid_quota", "slip_file", "updated_at", "invite_sent"]
+LOGS_HEADER = ["timestamp", "user_id", "action", "detail"]
+
+GENERAL_QUESTIONS = [
+    "ดวงความรักเดือนนี้เป็นอย่างไร",
+    "การงานปีนี้จะรุ่งไหม",
+    "การเงินช่วงนี้จะดีขึ้นไหมคะ",
+    "ฝันว่างูรัดตัว หมายถึงอะไร",
+    "สุขภาพช่วงนี้ต้องระวังอะไรบ้าง",
+]
+LOTTERY_QUESTIONS = ["ขอเลขเด็ดงวดนี้", "หวยงวดนี้ออกอะไร", "เลขมงคลวันนี้", "เลขเด็ดวันนี้ครับ"]
+
+# สัดส่วน intent ของแต่ละสถานการณ์ (birthdate, general, lottery)
+SCENARIOS = {
+    "normal": (0.3, 0.55, 0.15),
+    "draw-day": (0.1, 0.2, 0.7),
+}
+
+
+def make_message(kind):
+    if kind == "birthdate":
+        return f"เกิด {random.randint(1, 28)}/{random.randint(1, 12)}/{random.randint(2500, 2550)}"
+    if kind == "lottery":
+        return random.choice(LOTTERY_QUESTIONS)
+    return random.choice(GENERAL_QUESTIONS)
+
+
+def make_events(count, users, scenario, seed):
+    random.seed(seed)
+    weights = SCENARIOS[scenario]
+    events = []
+    for i in range(count):
+        kind = random.choices(("birthdate", "general", "lottery"), weights)[0]
+        user_id = f"Ubench{random.randrange(users) if users else i:06d}"
+        events.append({
+            "type": "message",
+            "webhookEventId": f"evt{i:08d}",
+            "replyToken": f"rt{i:08d}",
+            "source": {"type": "user", "userId": user_id},
+            "message": {"type": "text", "id": f"m{i:08d}", "text": make_message(kind)},
+            "timestamp": int(time.time() * 1000),
+            "deliveryContext": {"isRedelivery": False},
+        })
+    return events
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    k = (len(values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def start_fakes(args):
+    line = FakeLine()
+    openai_fake = FakeOpenAI(latency=args.openai_latency, jitter=args.openai_jitter)
+    sheets = FakeSheets({"Users": [list(USERS_HEADER)], "Logs": [list(LOGS_HEADER)]}, latency=args.sheets_latency)
+    db_dir = tempfile.mkdtemp(prefix="dungjit-bench-")
+    os.environ.update({
+        "LINE_ACCESS_TOKEN": "bench",
+        "LINE_API_BASE": f"{line.url}/v2/bot",
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_API_BASE": f"{openai_fake.url}/v1",
+        "GOOGLE_SHEETS_ENDPOINT": sheets.url,
+        "GOOGLE_SHEET_ID": "bench-sheet",
+        "SHEET_NAME_USERS": "Users",
+        "SHEET_NAME_LOGS": "Logs",
+        "PUBLIC_URL": line.url,
+        "DATABASE_URL": f"sqlite:///{os.path.join(db_dir, 'bench.sqlite')}",
+    })
+    return line, openai_fake, sheets
+
+
+def start_server(kind):
+    # import หลังตั้ง env แล้วเท่านั้น
+    if kind == "asgi":
+        import uvicorn
+        import asgi_app
+
+        config = uvicorn.Config(asgi_app.application, host="127.0.0.1", port=0, log_level="warning", lifespan="on")
+        server = uvicorn.Server(config)
+        threading.Thread(target=server.run, daemon=True).start()
+        while not server.started:
+            time.sleep(0.05)
+        port = server.servers[0].sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}", lambda: setattr(server, "should_exit", True)
+
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    import app
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    httpd = make_server("127.0.0.1", 0, app.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{httpd.server_port}", httpd.shutdown
+
+
+class Sampler:
+    def __init__(self, interval=0.05):
+        self.peak_threads = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+        self._thread.start()
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def run(args):
+    line, openai_fake, sheets = start_fakes(args)
+    base_url, stop_server = start_server(args.server)
+    events = make_events(args.events, args.users, args.scenario, args.seed)
+
+    sent_at = {}
+    http_latency = []
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=args.senders))
+
+    def send(event):
+        body = json.dumps({"destination": "bench", "events": [event]}, ensure_ascii=False).encode("utf-8")
+        t0 = time.perf_counter()
+        sent_at[event["replyToken"]] = t0
+        session.post(f"{base_url}/webhook", data=body, headers={"Content-Type": "application/json"}, timeout=60)
+        http_latency.append(time.perf_counter() - t0)
+
+    sampler = Sampler()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.senders) as pool:
+        for i, event in enumerate(events):
+            # ยิงตามอัตราที่กำหนด (events/วินาที)
+            delay = started + i / args.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, event)
+    sent_done = time.perf_counter()
+
+    def shed():
+        return sum(1 for _, _, msgs in line.replies if "ผู้ใช้งานจำนวนมาก" in msgs[0].get("text", ""))
+
+    # ข้อความที่ถูกรวม (coalesce) ไม่มี push ของตัวเอง จึงรอจนไม่มี user ไหนค้างคำทำนายแทนการนับ push
+    from coalesce import pending_replies
+
+    deadline = time.perf_counter() + args.timeout
+    while pending_replies.users and time.perf_counter() < deadline:
+        time.sleep(0.1)
+    finished = time.perf_counter()
+    sampler.stop()
+
+    # latency ของแต่ละ push นับจากข้อความที่ได้ "กรุณารอสักครู่" ล่าสุดของผู้ใช้คนนั้นก่อน push
+    # (push รอบที่รวมข้อความตามมาจึงนับจากข้อความแรกของ burst)
+    user_of = {event["replyToken"]: event["source"]["userId"] for event in events}
+    accepted = defaultdict(list)
+    for _, reply_token, msgs in line.replies:
+        if "รอสักครู่" in msgs[0].get("text", ""):
+            accepted[user_of[reply_token]].append(sent_at[reply_token])
+    latencies = []
+    for pushed_at, user_id, _ in line.pushes:
+        times = sorted(accepted.get(user_id, ()))
+        i = bisect.bisect_right(times, pushed_at)
+        if i:
+            latencies.append(pushed_at - times[i - 1])
+
+    stop_server()
+    # fake server อยู่ใน process เดียวกัน ตัวเลข RSS จึงรวมส่วนของมันด้วย
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    calls = line.calls + openai_fake.calls + sheets.calls
+    report = {
+        "server": args.server,
+        "scenario": args.scenario,
+        "events": len(events),
+        "pushed": len(line.pushes),
+        "shed_busy": shed(),
+        "coalesced": len(events) - sum(map(len, accepted.values())) - shed(),
+        "send_rate_eps": round(len(events) / (sent_done - started), 1),
+        "throughput_pushes_per_s": round(len(line.pushes) / (finished - started), 2),
+        "webhook_http_ms": {p: round(percentile(http_latency, p) * 1000, 1) for p in (50, 95, 99)},
+        "webhook_to_push_s": {p: round(percentile(latencies, p), 3) for p in (50, 95, 99)},
+        "peak_threads": sampler.peak_threads,
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "openai_prompt_chars": openai_fake.prompt_chars,
+        "upstream_calls": dict(sorted(calls.items())),
+    }
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        for key, value in report.items():
+            print(f"{key:>26}: {value}")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline webhook load test")
+    parser.add_argument("--server", choices=("wsgi", "asgi"), default="wsgi")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="normal")
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=20, help="webhook events per second")
+    parser.add_argument("--users", type=int, default=0, help="distinct users (0 = one per event)")
+    parser.add_argument("--senders", type=int, default=32, help="concurrent webhook senders")
+    parser.add_argument("--openai-latency", type=float, default=1.5)
+    parser.add_argument("--openai-jitter", type=float, default=0.5)
+    parser.add_argument("--sheets-latency", type=float, default=0.3)
+    parser.add_argument("--timeout", type=float, default=120, help="max seconds to wait for pushes")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true")
+    return run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
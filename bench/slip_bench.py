@@ -0,0 +1,117 @@
+# Micro-benchmark ของ pipeline OCR สลิป ใช้รูปใน slips/
+#
+#   python -m bench.slip_bench --repeat 5
+#
+# วัดเวลาแต่ละขั้น (decode, hash_lookup, preprocess, ocr_amount, ocr_name, ocr_full) ของ slip_ocr
+# เทียบกับ pipeline เดิม (imread -> resize -> imwrite -> Image.open -> OCR ทั้งภาพ)
+# แล้วเรียก process_slip_async ตรง ๆ (ไม่ผ่าน Celery broker) ทั้งรอบแรกและรอบส่งซ้ำ
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.load_test import percentile, start_fakes  # noqa: E402
+
+
+def legacy_ocr(filepath):
+    import cv2
+    import pytesseract
+    from PIL import Image
+
+    img = cv2.imread(filepath)
+    h, w = img.shape[:2]
+    if w > 1000:
+        img = cv2.resize(img, (1000, int(h * 1000 / w)))
+        cv2.imwrite(filepath, img)
+    return pytesseract.image_to_string(Image.open(filepath), lang="eng+tha")
+
+
+def summarize(name, samples):
+    if not samples:
+        return
+    print(f"{name:>14}: p50 {percentile(samples, 50):8.1f} ms   p95 {percentile(samples, 95):8.1f} ms   n={len(samples)}")
+
+
+def run(args):
+    import pytesseract
+
+    files = sorted(
+        os.path.join(args.slips, f) for f in os.listdir(args.slips)
+        if f.lower().endswith((".jpg", ".jpeg", ".png"))
+    )
+    if not files:
+        print("ไม่พบรูปใน", args.slips)
+        return
+    workdir = tempfile.mkdtemp(prefix="dungjit-slips-")
+
+    # fake LINE / Sheets + SQLite ชั่วคราว ก่อน import tasks
+    fakes = start_fakes(SimpleNamespace(openai_latency=0, openai_jitter=0, sheets_latency=args.sheets_latency))
+    line = fakes[0]
+    import slip_index
+    from slip_ocr import StageTimer, load_slip, ocr_image
+
+    stages = defaultdict(list)
+    has_tesseract = True
+    for _ in range(args.repeat):
+        for path in files:
+            timer = StageTimer()
+            data, img = load_slip(path)
+            timer.lap("decode")
+            slip_index.find(*slip_index.slip_keys(data, img))
+            timer.lap("hash_lookup")
+            for stage in ("decode", "hash_lookup"):
+                stages[stage].append(timer.timings[stage])
+            if not has_tesseract:
+                continue
+            try:
+                _, _, timings = ocr_image(img, timer)
+                if args.legacy:
+                    copy = os.path.join(workdir, os.path.basename(path))
+                    shutil.copy(path, copy)
+                    t0 = time.perf_counter()
+                    legacy_ocr(copy)
+                    stages["legacy_total"].append((time.perf_counter() - t0) * 1000)
+            except pytesseract.TesseractNotFoundError:
+                print("⚠️ ไม่พบ tesseract ในเครื่องนี้ วัดได้เฉพาะขั้นก่อน OCR")
+                has_tesseract = False
+                continue
+            for stage in ("preprocess", "ocr_amount", "ocr_name", "ocr_full", "total"):
+                if stage in timings:
+                    stages[stage].append(timings[stage])
+
+    print("=== slip_ocr stages ===")
+    for stage, samples in stages.items():
+        summarize(stage, samples)
+
+    # end-to-end: รอบแรก OCR + เพิ่มสิทธิ์, รอบสองต้องตอบจาก index
+    from tasks import process_slip_async
+
+    print("=== process_slip_async ===")
+    for label in ("first", "resubmit"):
+        samples = []
+        for i, path in enumerate(files):
+            t0 = time.perf_counter()
+            process_slip_async(f"Ubenchslip{i:04d}", "bench", path)
+            samples.append((time.perf_counter() - t0) * 1000)
+        summarize(label, samples)
+    for _, _, messages in line.pushes:
+        print("   push:", messages[0]["text"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Slip OCR micro-benchmark")
+    parser.add_argument("--slips", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "slips"))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--legacy", action="store_true", help="also time the old imread/imwrite/Image.open path")
+    parser.add_argument("--sheets-latency", type=float, default=0.0)
+    run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# === CONFIG ===
+SEEN_EVENTS_MAX = int(os.getenv("SEEN_EVENTS_MAX", 10000))
+# LINE ส่ง event ซ้ำเมื่อเราตอบ webhook ช้า (redelivery) จำ id ไว้นานพอให้ครอบคลุม
+SEEN_EVENTS_TTL = float(os.getenv("SEEN_EVENTS_TTL", 3600))
+# จำนวนข้อความสูงสุดที่รวมเป็นคำถามเดียว (เก็บข้อความล่าสุด)
+COALESCE_MAX_MESSAGES = int(os.getenv("COALESCE_MAX_MESSAGES", 5))
+
+
+class SeenSet:
+    """Bounded set of recently seen ids; entries expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize=SEEN_EVENTS_MAX, ttl=SEEN_EVENTS_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check_and_add(self, key):
+        # คืน True ถ้าเคยเห็น key นี้แล้ว (ภายใน ttl) ไม่เช่นนั้นจดไว้แล้วคืน False
+        now = time.monotonic()
+        with self._lock:
+            while self._seen:
+                oldest, seen_at = next(iter(self._seen.items()))
+                if now - seen_at < self.ttl:
+                    break
+                del self._seen[oldest]
+            if key in self._seen:
+                return True
+            self._seen[key] = now
+            if len(self._seen) > self.maxsize:
+                self._seen.popitem(last=False)
+            return False
+
+    def __len__(self):
+        return len(self._seen)
+
+
+class Coalescer:
+    """Per-user mailbox that folds a burst of messages into one fortune.
+
+    add() returns True for the first message of a user with nothing pending;
+    the caller then schedules one job that calls take() in a loop. Messages
+    that arrive while that job is still working are queued and come back from
+    the next take() joined into a single question, so a burst of N messages
+    costs at most two OpenAI calls and two pushes instead of N.
+    """
+
+    def __init__(self, max_messages=COALESCE_MAX_MESSAGES):
+        self.max_messages = max_messages
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def add(self, user_id, message):
+        with self._lock:
+            if user_id in self._pending:
+                self._pending[user_id].append(message)
+                return False
+            self._pending[user_id] = [message]
+            return True
+
+    def take(self, user_id):
+        # คืนข้อความที่รออยู่รวมเป็นข้อความเดียว หรือ None เมื่อหมดแล้ว (ปล่อย user ให้เริ่มงานใหม่ได้)
+        with self._lock:
+            messages = self._pending.get(user_id)
+            if not messages:
+                self._pending.pop(user_id, None)
+                return None
+            self._pending[user_id] = []
+        return "\n".join(messages[-self.max_messages:])
+
+    def cancel(self, user_id):
+        with self._lock:
+            self._pending.pop(user_id, None)
+
+    @property
+    def users(self):
+        return len(self._pending)
+
+
+def event_key(event):
+    # webhookEventId มีทุก event; message id เป็นตัวสำรองสำหรับ payload รุ่นเก่า
+    return event.get("webhookEventId") or event.get("message", {}).get("id")
+
+
+seen_events = SeenSet()
+pending_replies = Coalescer()
@@ -1,9 +1,18 @@
 # db_setup.py
-from sqlalchemy import create_engine, Column, Integer, String, DateTime
+import os
+import tempfile
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, String, DateTime, Boolean
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 
+try:
+    import fcntl
+except ImportError:  # Windows: ไม่มี file lock
+    fcntl = None
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///db.sqlite")
+
 Base = declarative_base()
 
 class User(Base):
@@ -14,15 +23,97 @@ class User(Base):
     paid_quota = Column(Integer, default=5)
     slip_file = Column(String)
     last_uploaded = Column(DateTime)
+    invite_sent = Column(Boolean, default=False)
+    birthdate = Column(String)  # dd/mm/yyyy ตามที่ normalize_birthdate คืนมา
 
 class Log(Base):
     __tablename__ = 'logs'
     id = Column(Integer, primary_key=True)
-    line_id = Column(String)
+    line_id = Column(String, index=True)
     action = Column(String)
     detail = Column(String)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+class CachedResponse(Base):
+    __tablename__ = 'response_cache'
+    key = Column(String, primary_key=True)  # เช่น birthdate:17/10/2536, lottery:2025-07-01
+    value = Column(String)
+    expires_at = Column(DateTime, index=True)
+
+class SlipHash(Base):
+    __tablename__ = 'slip_hashes'
+    id = Column(Integer, primary_key=True)
+    sha256 = Column(String, unique=True, index=True)
+    ref = Column(String, unique=True, index=True)  # เลขที่รายการ (จาก QR หรือ OCR)
+    amount = Column(String)
+    name = Column(String)
+    line_id = Column(String, index=True)
+    slip_file = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class SyncState(Base):
+    __tablename__ = 'sync_state'
+    key = Column(String, primary_key=True)  # เช่น users_seed = pending / done
+    value = Column(String)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
 # สร้างฐานข้อมูล
-engine = create_engine('sqlite:///db.sqlite')
-Base.metadata.create_all(engine)
+engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {})
+SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
+
+# process ที่ fork ออกไป (Celery prefork, gunicorn) ห้ามใช้ connection ที่ได้มาจาก parent
+# close=False: ทิ้ง pool เฉย ๆ ไม่ปิด connection ที่ parent ยังใช้อยู่
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
+if DATABASE_URL.startswith("sqlite"):
+    # WAL ให้ gunicorn หลาย worker กับ celery อ่าน/เขียนไฟล์เดียวกันได้โดยไม่บล็อกกัน
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
+def _migrate():
+    # create_all ไม่เพิ่มคอลัมน์/index ให้ตารางที่มีอยู่แล้ว (db.sqlite เดิม)
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(engine.dialect)
+                with engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+def _init_sync_state():
+    # ฐานข้อมูลที่เพิ่งสร้างใหม่ (เช่น หลัง restart บนเครื่องที่ไม่มี disk ถาวร) ต้องดึงผู้ใช้คืนจาก Users sheet
+    # ก่อน ไม่เช่นนั้น sheet mirror จะเขียนทับโควตาที่จ่ายแล้วด้วยค่าเริ่มต้น (ดู storage.seed_users)
+    with SessionLocal() as session:
+        if session.get(SyncState, "users_seed") is None:
+            fresh = session.query(User.id).first() is None
+            session.add(SyncState(key="users_seed", value="pending" if fresh else "done"))
+            session.commit()
+
+def _init_db():
+    Base.metadata.create_all(engine)
+    _migrate()
+    _init_sync_state()
+
+def _init_lock_path():
+    database = engine.url.database if DATABASE_URL.startswith("sqlite") else None
+    if database and database != ":memory:":
+        return f"{database}.init.lock"
+    return os.path.join(tempfile.gettempdir(), "dungjit-db-init.lock")
+
+# gunicorn worker / Celery import โมดูลนี้พร้อมกัน: ให้สร้างตาราง/ALTER TABLE ทีละ process
+# ไม่เช่นนั้นตัวที่ช้ากว่าจะล้มด้วย "duplicate column"
+if fcntl is not None:
+    with open(_init_lock_path(), "a") as _lock_file:
+        fcntl.flock(_lock_file, fcntl.LOCK_EX)
+        _init_db()
+else:
+    _init_db()
@@ -0,0 +1,60 @@
+# fortune_common.py — ของที่ app.py (Flask) และ asgi_app.py ใช้ร่วมกัน
+# import แล้วไม่มีผลข้างเคียง: ไม่สร้าง Flask app, ไม่เริ่ม thread, ไม่เชื่อมต่อ Sheets/LINE
+import os
+from datetime import datetime, timedelta
+
+import backends
+import metrics
+import storage
+from intents import build_prompt
+
+# === CONFIG ===
+# วินาทีสูงสุดที่รอ OpenAI ต่อคำถาม ไม่ให้ worker ค้างกับ request ที่ไม่ตอบ
+FORTUNE_TIMEOUT = float(os.getenv("FORTUNE_TIMEOUT", 90))
+
+INVITE_TEXT = (
+    "📢 ขอบคุณที่ใช้งาน ดวงจิตหมอดู AI บ่อย!\n"
+    "เพื่อสนับสนุนเรา ขอเชิญคุณช่วยแชร์ลิงก์เพิ่มเพื่อนให้เพื่อนของคุณ "
+    "เพิ่มเพื่อนที่นี่เลย 👉 https://lin.ee/7LgReP1"
+)
+
+
+# === งวดหวย (ออกวันที่ 1 และ 16) ===
+def current_draw_date(now=None):
+    now = now or datetime.now()
+    if now.day <= 1:
+        return datetime(now.year, now.month, 1)
+    if now.day <= 16:
+        return datetime(now.year, now.month, 16)
+    return datetime(now.year + now.month // 12, now.month % 12 + 1, 1)
+
+
+def lottery_cache_key():
+    # เลขเด็ดงวดเดียวกันได้คำตอบเหมือนกันทุกคน แคชไว้จนถึงวันออกรางวัล
+    draw_date = current_draw_date()
+    ttl = (draw_date + timedelta(days=1) - datetime.now()).total_seconds()
+    return f"lottery:{draw_date:%Y-%m-%d}", ttl
+
+
+# === OPENAI ===
+def ask_gpt(prompt):
+    with metrics.timed("openai"):
+        response = backends.openai_client().ChatCompletion.create(
+            model="gpt-4o",
+            messages=[{"role": "user", "content": prompt}],
+            request_timeout=FORTUNE_TIMEOUT,
+        )
+    return response.choices[0].message["content"].strip()
+
+
+def birthdate_reading(birthdate_text, facts=None):
+    return ask_gpt(build_prompt("birthdate", birthdate_text, facts))
+
+
+# === LOG USAGE ===
+@metrics.timed("log_usage")
+def log_usage(user_id, action, detail):
+    try:
+        storage.add_log(user_id, action, detail)
+    except Exception as e:
+        print("Log error:", e)
@@ -0,0 +1,8 @@
+# นำเข้าข้อมูลจาก Google Sheets (Users / Logs) เข้า SQLite ครั้งเดียว
+# ใช้: python import_sheets.py
+from backends import SHEET_NAME_LOGS, SHEET_NAME_USERS, worksheet
+from storage import import_from_sheets
+
+if __name__ == "__main__":
+    users, logs = import_from_sheets(worksheet(SHEET_NAME_USERS), worksheet(SHEET_NAME_LOGS))
+    print(f"✅ นำเข้าผู้ใช้ {users} ราย, log {logs} แถว")
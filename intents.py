@@ -0,0 +1,102 @@
+import re
+
+import astrology
+import metrics
+
+# จัดประเภทคำถามในเครื่องด้วย regex ที่ compile ไว้ล่วงหน้า แล้วส่ง prompt สั้นเฉพาะเรื่องให้ OpenAI
+# แทน prompt รวมทุกศาสตร์ (ที่มี template เลขเด็ดยาว ๆ ติดไปทุกคำถาม)
+
+THAI_TEXT_PATTERN = re.compile(r'^[\u0E00-\u0E7F0-9\s\.,\?!]+$')
+BIRTHDATE_PATTERN = re.compile(r'\d{1,2}[-/]\d{1,2}[-/]\d{2,4}')
+LOTTERY_PATTERN = re.compile(r"เลขเด็ด|หวย|เลขมงคล")
+
+# เรียงตามลำดับความสำคัญ: ตัวแรกที่ match ชนะ (เช่น "แต่งงาน" เป็นเรื่องความรัก ไม่ใช่การงาน)
+INTENT_TABLE = [
+    ("birthdate", BIRTHDATE_PATTERN),
+    ("lottery", LOTTERY_PATTERN),
+    ("dream", re.compile(r"ฝัน")),
+    ("love", re.compile(r"ความรัก|คู่รัก|คนรัก|แฟน|เนื้อคู่|คู่ครอง|แต่งงาน|โสด|จีบ|อกหัก|สามี|ภรรยา|รัก")),
+    ("money", re.compile(r"การเงิน|เงิน|โชคลาภ|ร่ำรวย|รวย|หนี้|ลงทุน|หุ้น|ค้าขาย|ขายของ|ทรัพย์")),
+    ("work", re.compile(r"การงาน|งาน|อาชีพ|ตำแหน่ง|เจ้านาย|หัวหน้า|ธุรกิจ|สอบ|สัมภาษณ์|ย้ายงาน")),
+]
+INTENTS = [name for name, _ in INTENT_TABLE] + ["general"]
+
+ROUTED = metrics.Counter("dungjit_intent_routed_total", "Questions by locally classified intent.")
+PROMPT_CHARS = metrics.Counter("dungjit_prompt_chars_total", "Prompt characters sent to OpenAI by intent.")
+
+
+def is_valid_thai_text(text):
+    return bool(THAI_TEXT_PATTERN.match(text))
+
+
+def route(message):
+    for intent, pattern in INTENT_TABLE:
+        if pattern.search(message):
+            break
+    else:
+        intent = "general"
+    ROUTED.inc(intent=intent)
+    return intent
+
+
+# === PROMPTS ===
+PERSONA = "คุณคือหมอดูไทยโบราณ ตอบเป็นภาษาไทยที่สุภาพ อบอุ่น กระชับ เหมาะกับการอ่านใน LINE"
+
+TOPIC_PROMPTS = {
+    "dream": "ทำนายฝันตามตำราไทย: ความหมายของฝัน เป็นลางดีหรือร้าย เลขมงคลจากฝัน 2-3 ชุด และคำแนะนำสั้น ๆ",
+    "love": "ดูดวงความรัก: แนวโน้มช่วงนี้ สิ่งที่ควรระวัง และวิธีเสริมดวงความรักแบบไทย (ทำบุญ ไหว้พระ สีมงคล)",
+    "money": "ดูดวงการเงินและโชคลาภ: แนวโน้มรายรับรายจ่าย จังหวะที่ดี ข้อควรระวัง และวิธีเสริมดวงการเงินแบบไทย",
+    "work": "ดูดวงการงาน: แนวโน้มหน้าที่การงาน ความสัมพันธ์กับหัวหน้า/เพื่อนร่วมงาน จังหวะเปลี่ยนงาน และวิธีเสริมดวง",
+    "general": "ตอบคำถามด้วยศาสตร์ไทยที่เหมาะสมที่สุด พร้อมคำแนะนำเสริมดวงและข้อคิดให้กำลังใจ",
+}
+
+
+def build_birthdate_prompt(birthdate_text, facts=None):
+    facts = facts or astrology.reading(birthdate_text)
+    context = f"\nข้อมูลที่คำนวณแล้ว (ใช้ตามนี้ ไม่ต้องคำนวณใหม่): {astrology.format_context(facts)}\n" if facts else ""
+    return f"""
+{PERSONA}
+
+ผู้ใช้เกิดวันที่: {birthdate_text}
+{context}
+วิเคราะห์ดวงชะตาจากวันเดือนปีเกิดตามหลักโหราศาสตร์ไทย: วันเกิด ปีนักษัตร จุดเด่น จุดอ่อน คำเตือน และวิธีเสริมดวง เช่น การทำบุญ การสวดมนต์ พร้อมข้อคิดให้กำลังใจ
+"""
+
+
+def build_lottery_prompt():
+    return f"""
+{PERSONA}
+
+สมมุติว่าคุณเป็นนักข่าวหวยชื่อดัง รวบรวมเลขเด็ดเลขดังจากหลายสำนักในประเทศไทยสำหรับงวดปัจจุบัน (วันที่ 1 หรือ 16 ของเดือนนี้) แยกหัวข้อและใช้ Emoji ในรูปแบบนี้:
+- 📌 ม้าวิ่ง: เลขท้าย 2 ตัว และ 3 ตัว
+- 📌 แม่น้ำหนึ่ง: เลขท้าย 2 ตัว และ 3 ตัว
+- 📌 เพชรกล้า: เลขเด่น, คู่เลขจับเด่น
+- 📌 เลขธูป (ถ้ามี): เลขธูป 3 ตัว
+- 📌 เลขขันน้ำมนต์: เลขเด่น
+- 📌 เลขอั้น / เลขเจ้ามือไม่รับ: ถ้ามี
+- 📌 เลขที่ออกบ่อยย้อนหลัง 10 งวด: เลขท้าย 2 ตัว และ 3 ตัว พร้อมสถิติ
+
+สำนักไหนไม่มีข้อมูลให้ใส่ว่า “ยังไม่พบข้อมูล” แล้วปิดท้ายด้วย “ขอให้โชคดี มีลาภงวดนี้นะครับ 🙏🍀”
+"""
+
+
+def build_topic_prompt(intent, message):
+    return f"""
+{PERSONA}
+
+{TOPIC_PROMPTS[intent]}
+
+คำถาม: "{message}"
+"""
+
+
+def build_prompt(intent, message, facts=None):
+    # สร้างเฉพาะตอนจะส่งจริง (cache miss) ตัวนับจึงเท่ากับจำนวนตัวอักษรที่ส่งไป OpenAI
+    if intent == "birthdate":
+        prompt = build_birthdate_prompt(message, facts)
+    elif intent == "lottery":
+        prompt = build_lottery_prompt()
+    else:
+        prompt = build_topic_prompt(intent, message)
+    PROMPT_CHARS.inc(len(prompt), intent=intent)
+    return prompt
@@ -0,0 +1,85 @@
+import os
+import queue
+import threading
+import time
+
+# === CONFIG ===
+REPLY_WORKERS = int(os.getenv("REPLY_WORKERS", 8))
+REPLY_QUEUE_SIZE = int(os.getenv("REPLY_QUEUE_SIZE", 100))
+DRAIN_TIMEOUT = float(os.getenv("REPLY_DRAIN_TIMEOUT", 30))
+
+_STOP = object()
+
+
+class JobQueue:
+    """Fixed-size worker pool with a bounded backlog.
+
+    submit() never blocks: when the backlog is full it returns False so the
+    caller can shed the job (e.g. reply "busy") instead of piling up threads.
+    """
+
+    def __init__(self, workers=REPLY_WORKERS, maxsize=REPLY_QUEUE_SIZE, name="reply"):
+        self.name = name
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._active = 0
+        self._threads = []
+        for i in range(workers):
+            t = threading.Thread(target=self._run, name=f"{name}-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, fn, *args, **kwargs):
+        if self._closed:
+            return False
+        try:
+            self._queue.put_nowait((fn, args, kwargs))
+        except queue.Full:
+            return False
+        return True
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    @property
+    def active(self):
+        return self._active
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                fn, args, kwargs = item
+                with self._lock:
+                    self._active += 1
+                try:
+                    fn(*args, **kwargs)
+                except Exception as e:
+                    print(f"❌ {self.name} job error:", e)
+                finally:
+                    with self._lock:
+                        self._active -= 1
+            finally:
+                self._queue.task_done()
+
+    def shutdown(self, timeout=DRAIN_TIMEOUT):
+        # ปิดรับงานใหม่ แล้วรอให้งานที่ค้างในคิวทำจนเสร็จ
+        if self._closed:
+            return
+        self._closed = True
+        # ทุกขั้นใช้เวลารวมไม่เกิน timeout: ถ้าคิวยังเต็มจนหมดเวลาก็เลิกรอ (worker เป็น daemon thread)
+        deadline = time.monotonic() + timeout
+        for _ in self._threads:
+            try:
+                self._queue.put(_STOP, timeout=max(deadline - time.monotonic(), 0))
+            except queue.Full:
+                break
+        for t in self._threads:
+            t.join(max(deadline - time.monotonic(), 0))
+
+
+reply_queue = JobQueue()
@@ -0,0 +1,161 @@
+import asyncio
+import os
+import random
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# === CONFIG ===
+LINE_API_BASE = os.getenv("LINE_API_BASE", "https://api.line.me/v2/bot")
+LINE_TIMEOUT = float(os.getenv("LINE_TIMEOUT", 10))
+LINE_MAX_RETRIES = int(os.getenv("LINE_MAX_RETRIES", 3))
+LINE_POOL_SIZE = int(os.getenv("LINE_POOL_SIZE", 20))
+
+# ข้อจำกัดของ LINE Messaging API
+MAX_MESSAGES_PER_REQUEST = 5
+MAX_MULTICAST_RECIPIENTS = 500
+# X-Line-Retry-Key ใช้ได้กับ push/multicast/narrowcast/broadcast (reply ใช้ไม่ได้)
+RETRY_KEY_PATHS = ("/message/push", "/message/multicast", "/message/broadcast")
+
+
+def _retry_headers(path):
+    # หนึ่ง key ต่อการส่งหนึ่งครั้ง ใช้ซ้ำทุก retry: ถ้า LINE รับ request แรกไปแล้ว (แต่เรา timeout)
+    # retry จะได้ 409 แทนการส่งข้อความซ้ำถึงผู้ใช้
+    return {"X-Line-Retry-Key": str(uuid.uuid4())} if path in RETRY_KEY_PATHS else {}
+
+
+def text_messages(texts):
+    return [t if isinstance(t, dict) else {"type": "text", "text": t} for t in texts]
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class LineClient:
+    """Shared LINE Messaging API client.
+
+    Keeps one keep-alive connection pool per process, applies a timeout to
+    every call and retries 429/5xx/connection errors with jittered backoff,
+    honouring ``Retry-After`` when LINE sends one. Pushes carry one
+    ``X-Line-Retry-Key`` across their retries so LINE delivers them once.
+    """
+
+    def __init__(self, access_token, base_url=LINE_API_BASE, timeout=LINE_TIMEOUT,
+                 max_retries=LINE_MAX_RETRIES, pool_size=LINE_POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json",
+        })
+
+    def _post(self, path, body):
+        url = f"{self.base_url}{path}"
+        headers = _retry_headers(path)
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                with metrics.timed(f"line_{path.rsplit('/', 1)[-1]}"):
+                    response = self.session.post(url, json=body, headers=headers, timeout=self.timeout)
+                if response.status_code < 400 or response.status_code == 409:
+                    # 409 = retry key นี้ถูกรับไปแล้วในรอบก่อน ถือว่าส่งสำเร็จ
+                    return response
+                if response.status_code != 429 and response.status_code < 500:
+                    print(f"❌ LINE {path} {response.status_code}: {response.text}")
+                    return response
+                retry_after = response.headers.get("Retry-After")
+                error = f"HTTP {response.status_code}"
+            except requests.RequestException as e:
+                error = e
+            if attempt == self.max_retries:
+                print(f"❌ LINE {path} failed after {attempt + 1} attempts:", error)
+                return None
+            if retry_after and retry_after.isdigit():
+                delay = int(retry_after)
+            else:
+                delay = 0.5 * 2 ** attempt
+            time.sleep(delay + random.uniform(0, delay / 2))
+
+    # === SEND ===
+    def reply(self, reply_token, *texts):
+        messages = text_messages(texts)[:MAX_MESSAGES_PER_REQUEST]
+        return self._post("/message/reply", {"replyToken": reply_token, "messages": messages})
+
+    def push(self, user_id, *texts):
+        # หลายข้อความถึงผู้ใช้คนเดียว รวมเป็น request เดียว (ครั้งละไม่เกิน 5)
+        for messages in _chunks(text_messages(texts), MAX_MESSAGES_PER_REQUEST):
+            self._post("/message/push", {"to": user_id, "messages": messages})
+
+    def multicast(self, user_ids, *texts):
+        user_ids = list(user_ids)
+        for messages in _chunks(text_messages(texts), MAX_MESSAGES_PER_REQUEST):
+            for recipients in _chunks(user_ids, MAX_MULTICAST_RECIPIENTS):
+                self._post("/message/multicast", {"to": recipients, "messages": messages})
+
+    def broadcast(self, *texts):
+        for messages in _chunks(text_messages(texts), MAX_MESSAGES_PER_REQUEST):
+            self._post("/message/broadcast", {"messages": messages})
+
+
+class AsyncLineClient:
+    """asyncio counterpart of LineClient for the ASGI app (see asgi_app.py)."""
+
+    def __init__(self, access_token, base_url=LINE_API_BASE, timeout=LINE_TIMEOUT,
+                 max_retries=LINE_MAX_RETRIES, pool_size=LINE_POOL_SIZE):
+        import httpx
+
+        self._httpx = httpx
+        self.max_retries = max_retries
+        self.client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            headers={"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"},
+        )
+
+    async def _post(self, path, body):
+        headers = _retry_headers(path)
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                with metrics.timed(f"line_{path.rsplit('/', 1)[-1]}"):
+                    response = await self.client.post(path, json=body, headers=headers)
+                if response.status_code < 400 or response.status_code == 409:
+                    return response
+                if response.status_code != 429 and response.status_code < 500:
+                    print(f"❌ LINE {path} {response.status_code}: {response.text}")
+                    return response
+                retry_after = response.headers.get("Retry-After")
+                error = f"HTTP {response.status_code}"
+            except self._httpx.HTTPError as e:
+                error = e
+            if attempt == self.max_retries:
+                print(f"❌ LINE {path} failed after {attempt + 1} attempts:", error)
+                return None
+            if retry_after and retry_after.isdigit():
+                delay = int(retry_after)
+            else:
+                delay = 0.5 * 2 ** attempt
+            await asyncio.sleep(delay + random.uniform(0, delay / 2))
+
+    async def reply(self, reply_token, *texts):
+        messages = text_messages(texts)[:MAX_MESSAGES_PER_REQUEST]
+        return await self._post("/message/reply", {"replyToken": reply_token, "messages": messages})
+
+    async def push(self, user_id, *texts):
+        for messages in _chunks(text_messages(texts), MAX_MESSAGES_PER_REQUEST):
+            await self._post("/message/push", {"to": user_id, "messages": messages})
+
+    async def aclose(self):
+        await self.client.aclose()
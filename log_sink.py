@@ -0,0 +1,89 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import metrics
+
+# === CONFIG ===
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", 50))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", 5))
+# จำนวนแถวสูงสุดที่ค้างไว้ในหน่วยความจำตอน Sheets ล่ม (เกินแล้วทิ้งแถวเก่าสุด)
+LOG_MAX_BUFFER = int(os.getenv("LOG_MAX_BUFFER", 5000))
+LOG_MAX_BACKOFF = float(os.getenv("LOG_MAX_BACKOFF", 300))
+
+
+class BufferedLogWriter:
+    """Collects log rows in memory and ships them with ``append_rows``.
+
+    A background thread flushes when ``batch_size`` rows are waiting or every
+    ``flush_interval`` seconds. Failed batches stay buffered and are retried
+    with exponential backoff; the buffer is capped at ``max_buffer`` rows.
+    """
+
+    def __init__(self, sheet, batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_INTERVAL,
+                 max_buffer=LOG_MAX_BUFFER):
+        self.sheet = sheet
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._buffer = deque(maxlen=max_buffer)
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._failures = 0
+        self._retry_at = 0
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, row):
+        with self._cond:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append(row)
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+
+    @property
+    def pending(self):
+        return len(self._buffer)
+
+    def _run(self):
+        while not self._closed:
+            with self._cond:
+                self._cond.wait(self.flush_interval)
+            if time.time() >= self._retry_at:
+                self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            while self._buffer:
+                with self._cond:
+                    batch = [self._buffer[i] for i in range(min(self.batch_size, len(self._buffer)))]
+                try:
+                    with metrics.timed("sheets_log_append"):
+                        self.sheet.append_rows(batch)
+                except Exception as e:
+                    self._failures += 1
+                    delay = min(LOG_MAX_BACKOFF, self.flush_interval * 2 ** self._failures)
+                    self._retry_at = time.time() + delay * random.uniform(0.5, 1.0)
+                    print(f"Log error ({len(self._buffer)} rows pending):", e)
+                    return False
+                with self._cond:
+                    # แถวเก่าอาจถูกดันออกไปแล้วถ้า buffer เต็มระหว่างส่ง
+                    for row in batch:
+                        if self._buffer and self._buffer[0] is row:
+                            self._buffer.popleft()
+                self._failures = 0
+                self._retry_at = 0
+            return True
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        with self._cond:
+            self._cond.notify()
+        self._thread.join(self.flush_interval)
+        self.flush()
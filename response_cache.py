@@ -0,0 +1,186 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import metrics
+
+# === CONFIG ===
+CACHE_MAX_SIZE = int(os.getenv("FORTUNE_CACHE_SIZE", 5000))
+CACHE_TTL = float(os.getenv("FORTUNE_CACHE_TTL", 7 * 24 * 3600))
+CACHE_PERSIST = os.getenv("FORTUNE_CACHE_PERSIST", "").lower() in ("1", "true", "yes")
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+    """Size-bounded LRU cache with TTL and single-flight fills.
+
+    Concurrent ``get_or_compute`` calls for the same key share one call to
+    ``compute``; failures are propagated to every waiter and never cached.
+    With ``persist`` the entries are also stored in SQLite so they survive
+    restarts and are shared between gunicorn workers.
+    """
+
+    def __init__(self, maxsize=CACHE_MAX_SIZE, ttl=CACHE_TTL, persist=CACHE_PERSIST):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.persist = persist
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._async_inflight = {}
+        self._lock = threading.Lock()
+
+    def _get_memory(self, key, now):
+        # เรียกขณะถือ self._lock
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                return value
+            del self._entries[key]
+        return None
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            value = self._get_memory(key, now)
+        if value is not None:
+            return value
+        if self.persist:
+            entry = self._load(key)
+            if entry is not None and entry[0] > now:
+                self._store(key, *entry)
+                return entry[1]
+        return None
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        self._store(key, expires_at, value)
+        if self.persist:
+            self._save(key, expires_at, value)
+
+    def _store(self, key, expires_at, value):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute, ttl=None):
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        with self._lock:
+            # leader คนก่อนอาจเพิ่ง set แล้วออกจาก _inflight ไปหลังจาก get() ข้างบนพลาด
+            value = self._get_memory(key, time.time())
+            if value is not None:
+                self.hits += 1
+                return value
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+        if not leader:
+            self.coalesced += 1
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        self.misses += 1
+        try:
+            call.value = compute()
+            self.set(key, call.value, ttl)
+            return call.value
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.event.set()
+
+    async def get_or_compute_async(self, key, compute, ttl=None):
+        # เหมือน get_or_compute แต่ compute เป็น coroutine function (ใช้ใน asgi_app)
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        future = self._async_inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = self._async_inflight[key] = asyncio.get_running_loop().create_future()
+        self.misses += 1
+        try:
+            value = await compute()
+            self.set(key, value, ttl)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            # leader ถูกยกเลิก (เช่น REPLY_JOB_TIMEOUT) ให้ waiter ได้ error ปกติแทน CancelledError
+            # ไม่เช่นนั้น task ของ waiter จะตายไปด้วยทั้งที่ตัวเองไม่ได้ถูกยกเลิก
+            future.set_exception(TimeoutError(f"computing {key!r} was cancelled"))
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # waiters re-raise it; don't warn when there are none
+            raise
+        finally:
+            del self._async_inflight[key]
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
+
+    # === SQLITE PERSISTENCE ===
+    def _load(self, key):
+        from db_setup import SessionLocal, CachedResponse
+        try:
+            with SessionLocal() as session:
+                row = session.get(CachedResponse, key)
+                if row is None:
+                    return None
+                return row.expires_at.timestamp(), row.value
+        except Exception as e:
+            print("Cache load error:", e)
+            return None
+
+    def _save(self, key, expires_at, value):
+        from db_setup import SessionLocal, CachedResponse
+        try:
+            with SessionLocal() as session:
+                session.merge(CachedResponse(key=key, value=value, expires_at=datetime.fromtimestamp(expires_at)))
+                session.commit()
+        except Exception as e:
+            print("Cache save error:", e)
+
+
+fortune_cache = ResponseCache()
+
+metrics.CallbackCounter("dungjit_fortune_cache_hits_total", "Fortune cache hits.", lambda: fortune_cache.hits)
+metrics.CallbackCounter("dungjit_fortune_cache_misses_total", "Fortune cache misses (upstream calls).", lambda: fortune_cache.misses)
+metrics.CallbackCounter("dungjit_fortune_cache_coalesced_total", "Requests that waited on an in-flight fill.",
+                        lambda: fortune_cache.coalesced)
+metrics.Gauge("dungjit_fortune_cache_entries", "Entries held in the fortune cache.", lambda: len(fortune_cache._entries))
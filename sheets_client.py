@@ -0,0 +1,43 @@
+import os
+
+import gspread
+import requests
+from google.oauth2.service_account import Credentials
+
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+SHEETS_API_BASE = "https://sheets.googleapis.com"
+
+
+class _EndpointSession(requests.Session):
+    def __init__(self, endpoint):
+        super().__init__()
+        self.endpoint = endpoint.rstrip("/")
+
+    def request(self, method, url, *args, **kwargs):
+        if url.startswith(SHEETS_API_BASE):
+            url = self.endpoint + url[len(SHEETS_API_BASE):]
+        return super().request(method, url, *args, **kwargs)
+
+
+def service_account_info():
+    return {
+        "type": os.getenv("GOOGLE_TYPE"),
+        "project_id": os.getenv("GOOGLE_PROJECT_ID"),
+        "private_key_id": os.getenv("GOOGLE_PRIVATE_KEY_ID"),
+        "private_key": os.getenv("GOOGLE_PRIVATE_KEY").replace('\\n', '\n'),
+        "client_email": os.getenv("GOOGLE_CLIENT_EMAIL"),
+        "client_id": os.getenv("GOOGLE_CLIENT_ID"),
+        "auth_uri": os.getenv("GOOGLE_AUTH_URI"),
+        "token_uri": os.getenv("GOOGLE_TOKEN_URI"),
+        "auth_provider_x509_cert_url": os.getenv("GOOGLE_AUTH_PROVIDER_X509_CERT_URL"),
+        "client_x509_cert_url": os.getenv("GOOGLE_CLIENT_X509_CERT_URL"),
+    }
+
+
+def authorize():
+    # GOOGLE_SHEETS_ENDPOINT ชี้ไปที่ Sheets API จำลอง (เช่น bench/fakes.py) แทน Google จริง
+    endpoint = os.getenv("GOOGLE_SHEETS_ENDPOINT")
+    if endpoint:
+        return gspread.Client(auth=None, session=_EndpointSession(endpoint))
+    creds = Credentials.from_service_account_info(service_account_info(), scopes=SCOPES)
+    return gspread.authorize(creds)
@@ -0,0 +1,100 @@
+import hashlib
+import os
+
+import cv2
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from db_setup import SessionLocal, SlipHash
+
+# === CONFIG ===
+# สลิปโอนเงินไทยมี QR สำหรับตรวจสอบสลิป ข้างในคือเลขที่รายการของธนาคาร ซึ่งไม่เปลี่ยนแม้แคปหน้าจอ
+# ครอบตัด หรือบีบอัดใหม่ ต่างจาก hash ของภาพ จึงใช้เลขนี้ (unique) เป็นตัวตัดสินว่าสลิปซ้ำ
+QR_MAX_WIDTH = int(os.getenv("SLIP_QR_MAX_WIDTH", 800))
+
+_qr_detector = None
+
+
+def _tlv(payload):
+    # แยก payload แบบ EMVCo (tag 2 หลัก, ความยาว 2 หลัก, ค่า)
+    fields, i = {}, 0
+    while i + 4 <= len(payload):
+        tag, length = payload[i:i + 2], payload[i + 2:i + 4]
+        if not length.isdigit():
+            break
+        fields[tag] = payload[i + 4:i + 4 + int(length)]
+        i += 4 + int(length)
+    return fields
+
+
+def qr_reference(img):
+    """Transaction reference from the slip-verification QR code, or None.
+
+    Decoding the QR takes tens of milliseconds, so a resent slip, including
+    a screenshot of one, is recognised before any OCR runs.
+    """
+    global _qr_detector
+    if _qr_detector is None:
+        _qr_detector = cv2.QRCodeDetector()
+    h, w = img.shape[:2]
+    if w > QR_MAX_WIDTH:
+        img = cv2.resize(img, (QR_MAX_WIDTH, int(h * QR_MAX_WIDTH / w)), interpolation=cv2.INTER_AREA)
+    try:
+        payload, _, _ = _qr_detector.detectAndDecode(img)
+    except cv2.error:
+        return None
+    # tag 00 = ข้อมูลรายการ: 00 API id, 01 รหัสธนาคารผู้โอน, 02 เลขที่รายการ
+    return _tlv(_tlv(payload).get("00", "")).get("02") or None
+
+
+def slip_keys(data, img):
+    return hashlib.sha256(data).hexdigest(), qr_reference(img)
+
+
+def find(sha256=None, ref=None):
+    # ไฟล์เดิมทุก byte หรือเลขที่รายการเดิม: ใช้ซ้ำแน่นอน ไม่ว่าใครส่ง
+    conditions = [column == value for column, value in ((SlipHash.sha256, sha256), (SlipHash.ref, ref)) if value]
+    if not conditions:
+        return None
+    with SessionLocal() as session:
+        return session.query(SlipHash).filter(or_(*conditions)).first()
+
+
+def entry(sha256, ref, amount, name=None, user_id=None, slip_file=None):
+    return SlipHash(sha256=sha256, ref=ref, amount=amount, name=name, line_id=user_id, slip_file=slip_file)
+
+
+def add(sha256, ref, amount, name=None, user_id=None, slip_file=None):
+    # คืนค่า False ถ้าสลิปเดียวกันถูกบันทึกไปแล้ว (เช่น ส่งซ้ำพร้อมกันสองครั้ง)
+    with SessionLocal() as session:
+        session.add(entry(sha256, ref, amount, name, user_id, slip_file))
+        try:
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+            return False
+    return True
+
+
+def build_index(slips_dir="slips"):
+    # สร้าง index ย้อนหลังจากสลิปที่มีอยู่แล้ว (OCR เฉพาะไฟล์ที่ยังไม่อยู่ใน index)
+    from slip_ocr import load_slip, ocr_image
+
+    added = 0
+    for filename in sorted(os.listdir(slips_dir)):
+        try:
+            data, img = load_slip(os.path.join(slips_dir, filename))
+        except (OSError, ValueError):
+            continue
+        sha256, ref = slip_keys(data, img)
+        if find(sha256, ref):
+            continue
+        _, info, _ = ocr_image(img)
+        ref = ref or info["ref"]
+        if info["amount"] and add(sha256, ref, info["amount"], info["name"], slip_file=filename):
+            added += 1
+    return added
+
+
+if __name__ == "__main__":
+    print(f"✅ เพิ่มสลิปเข้า index {build_index()} ใบ")
@@ -0,0 +1,111 @@
+import os
+import re
+import time
+
+import cv2
+import numpy as np
+import pytesseract
+
+import metrics
+
+# === CONFIG ===
+MAX_WIDTH = 1000
+# กรอบที่มักมี "จำนวน: xx.xx บาท" บนสลิป (x0, y0, x1, y1 เป็นสัดส่วนของภาพ)
+AMOUNT_REGION = tuple(float(v) for v in os.getenv("SLIP_AMOUNT_REGION", "0,0.55,0.7,1").split(","))
+# ตัวอักษรของ "จำนวน: xx บาท" และ "เลขที่รายการ: 0151...ABC..." (เลขที่รายการใช้ตัดสลิปซ้ำเมื่ออ่าน QR ไม่ได้)
+AMOUNT_WHITELIST = "0123456789.,:฿บาทจำนวนเลขที่รายการABCDEFGHIJKLMNOPQRSTUVWXYZ"
+AMOUNT_CONFIG = f"--psm 6 -c tessedit_char_whitelist={AMOUNT_WHITELIST} -c preserve_interword_spaces=1"
+# whitelist ข้างบนตัด "ชื่อ" ทิ้ง ถ้าผู้เรียกต้องการชื่อ (with_name=True) จะอ่านแยกอีกรอบเฉพาะแถบบรรทัดผู้โอน
+NAME_REGION = tuple(float(v) for v in os.getenv("SLIP_NAME_REGION", "0.2,0.12,0.8,0.32").split(","))
+NAME_CONFIG = "--psm 6"
+
+AMOUNT_WITH_CURRENCY = re.compile(r"(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(บาท|฿)")
+AMOUNT_ANY = re.compile(r"(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(บาท|฿)?")
+REFERENCE = re.compile(r"(?<![0-9A-Za-z])(\d[0-9A-Z]{11,29})(?![0-9A-Za-z])")
+
+
+def extract_name(text):
+    name = re.search(r"(ชื่อ[^\n\r]+)", text)
+    return name.group(1).strip() if name else None
+
+
+def extract_reference(text):
+    ref = REFERENCE.search(text)
+    return ref.group(1) if ref else None
+
+
+def extract_payment_info(text):
+    # ตัวเลขที่ตามด้วย "บาท" ก่อน จะได้ไม่ไปจับเลขที่รายการ/วันที่
+    amount = AMOUNT_WITH_CURRENCY.search(text) or AMOUNT_ANY.search(text)
+    return {
+        "amount": amount.group(1).replace(",", "") if amount else None,
+        "name": extract_name(text),
+        "ref": extract_reference(text),
+    }
+
+
+def _crop(img, region):
+    h, w = img.shape[:2]
+    x0, y0, x1, y1 = region
+    return img[int(h * y0):int(h * y1), int(w * x0):int(w * x1)]
+
+
+class StageTimer:
+    # จับเวลาแต่ละขั้น เก็บเป็น ms ไว้ใส่ log และส่งเข้า /metrics เป็น stage="slip_<ขั้น>"
+    def __init__(self, prefix="slip"):
+        self.prefix = prefix
+        self.timings = {}
+        self._t = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.timings[stage] = round((now - self._t) * 1000, 1)
+        metrics.STAGE_SECONDS.observe(now - self._t, stage=f"{self.prefix}_{stage}")
+        self._t = now
+
+
+def load_slip(filepath):
+    # อ่านไฟล์ครั้งเดียว: ได้ทั้ง bytes (ไว้ทำ hash) และภาพ grayscale (ไว้ OCR)
+    with open(filepath, "rb") as f:
+        data = f.read()
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE) if data else None
+    if img is None:
+        raise ValueError("ไม่สามารถอ่านภาพจากไฟล์ได้")
+    return data, img
+
+
+def ocr_image(img, timer=None, with_name=False):
+    """OCR a decoded grayscale slip in memory.
+
+    The image is downscaled and binarised, and only the amount region is read
+    with a digit/Thai whitelist; the payer line is read in a second small pass
+    only when ``with_name`` is set. If no amount followed by บาท/฿ is found in
+    the region, the whole slip is read. Returns ``(text, info, timings)`` with
+    per-stage timings in milliseconds.
+    """
+    timer = timer or StageTimer()
+    h, w = img.shape[:2]
+    if w > MAX_WIDTH:
+        img = cv2.resize(img, (MAX_WIDTH, int(h * MAX_WIDTH / w)), interpolation=cv2.INTER_AREA)
+    _, binary = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    timer.lap("preprocess")
+
+    # ในกรอบยอดเงินรับเฉพาะตัวเลขที่มี "บาท"/"฿" กำกับ ตัวเลขเปล่า ๆ อาจเป็นเลขที่รายการหรือเวลา
+    text = pytesseract.image_to_string(_crop(binary, AMOUNT_REGION), lang="eng+tha", config=AMOUNT_CONFIG)
+    amount = AMOUNT_WITH_CURRENCY.search(text)
+    timer.lap("ocr_amount")
+
+    if amount:
+        info = {"amount": amount.group(1).replace(",", ""), "name": None, "ref": extract_reference(text)}
+        if with_name:
+            name_text = pytesseract.image_to_string(_crop(binary, NAME_REGION), lang="eng+tha", config=NAME_CONFIG)
+            info["name"] = extract_name(name_text)
+            text = f"{name_text}\n{text}"
+            timer.lap("ocr_name")
+    else:
+        text = pytesseract.image_to_string(binary, lang="eng+tha")
+        info = extract_payment_info(text)
+        timer.lap("ocr_full")
+
+    timer.timings["total"] = round(sum(timer.timings.values()), 1)
+    return text, info, timer.timings
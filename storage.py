@@ -0,0 +1,338 @@
+import atexit
+import os
+import threading
+from datetime import datetime
+
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql, sqlite
+
+import metrics
+from db_setup import SessionLocal, SyncState, User, Log, engine
+from log_sink import BufferedLogWriter
+from user_store import UserStore
+
+# === CONFIG ===
+# user ที่เปลี่ยนในช่วงนี้ถูกรวมเขียนลง Users sheet ใน batch_update เดียว
+SHEET_SYNC_INTERVAL = float(os.getenv("SHEET_SYNC_INTERVAL", 5))
+# โควตาฟรีของผู้ใช้ใหม่ (ค่าเริ่มต้นของ users.paid_quota) ทุกทางที่สร้างแถวใหม่เริ่มจากค่านี้
+FREE_QUOTA = User.paid_quota.default.arg
+
+# SQLite คือข้อมูลหลัก ส่วน Google Sheets เป็นแค่มุมมองสำหรับรายงาน
+# ที่ถูก sync ตามหลังด้วย background thread (ไม่อยู่บน request path)
+_users_sheet = None
+_logs_sheet = None
+_user_store = None
+_mirror = None
+_log_writer = None
+_start_lock = threading.Lock()
+
+metrics.Gauge("dungjit_sheet_sync_queue_depth", "Changed users waiting to be mirrored to the Users sheet.",
+              lambda: _mirror.pending if _mirror else 0)
+metrics.Gauge("dungjit_log_buffer_rows", "Log rows buffered for the Logs sheet.",
+              lambda: _log_writer.pending if _log_writer else 0)
+metrics.CallbackCounter("dungjit_log_rows_dropped_total", "Log rows dropped because the buffer was full.",
+                        lambda: _log_writer.dropped if _log_writer else 0)
+
+
+def attach_sheets(users_sheet=None, logs_sheet=None):
+    global _users_sheet, _logs_sheet
+    _users_sheet = _users_sheet or users_sheet
+    _logs_sheet = _logs_sheet or logs_sheet
+    _start_writers()
+
+
+def _start_writers():
+    # thread ไม่ติดไปกับ process ที่ fork ออกไป (Celery prefork) จึงเริ่มใหม่ตอนใช้ครั้งแรกในแต่ละ process
+    global _user_store, _mirror, _log_writer
+    if (_mirror or _users_sheet is None) and (_log_writer or _logs_sheet is None):
+        return
+    with _start_lock:
+        if _users_sheet is not None and _mirror is None:
+            _user_store = UserStore(_users_sheet)
+            _mirror = _SheetMirror(_user_store)
+        if _logs_sheet is not None and _log_writer is None:
+            _log_writer = BufferedLogWriter(_logs_sheet)
+
+
+def _forget_writers():
+    global _user_store, _mirror, _log_writer, _start_lock
+    _user_store = _mirror = _log_writer = None
+    _start_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_writers)
+
+
+def close():
+    # ส่งของที่ค้างอยู่ลง Sheets ให้หมด: Users ก่อน แล้วค่อย Logs
+    # process ที่มีงานค้างในคิว (app.py) ต้องรอคิวให้เสร็จก่อนเรียกตัวนี้ ดู app.shutdown
+    if _mirror:
+        _mirror.close()
+    if _log_writer:
+        _log_writer.close()
+
+
+atexit.register(close)
+
+
+def _insert(table):
+    # INSERT ... ON CONFLICT มีทั้งใน SQLite (3.24+) และ PostgreSQL
+    dialect = postgresql if engine.dialect.name == "postgresql" else sqlite
+    return dialect.insert(table)
+
+
+# === USERS ===
+# ตัวนับทั้งหมดเพิ่มด้วย SQL (usage = usage + 1) ในคำสั่งเดียว จึงไม่มีการอ่าน-แก้-เขียนใน Python
+# ที่ทำให้ค่าหายเมื่อหลาย thread / gunicorn worker / Celery worker เขียนพร้อมกัน
+@metrics.timed("sqlite_record_question")
+def record_question(user_id, birthdate=None):
+    # คืนค่า (จำนวนคำถามทั้งหมด, เคยส่งคำเชิญแล้วหรือยัง)
+    # birthdate: วันเกิดล่าสุดที่ผู้ใช้ส่งมา เก็บไว้เตรียมคำทำนายล่วงหน้า (python astrology.py)
+    stmt = _insert(User).values(id=user_id, usage=1, birthdate=birthdate)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[User.id],
+        set_={
+            "usage": func.coalesce(User.usage, 0) + 1,
+            "birthdate": func.coalesce(stmt.excluded.birthdate, User.birthdate),
+        },
+    ).returning(User.usage, User.invite_sent)
+    with SessionLocal() as session:
+        usage, invite_sent = session.execute(stmt).one()
+        session.commit()
+    _sync_user(user_id)
+    return usage, bool(invite_sent)
+
+
+@metrics.timed("sqlite_claim_invite")
+def claim_invite(user_id):
+    # คืน True ให้ผู้เรียกรายเดียวเท่านั้น แม้หลาย worker เห็นจำนวนคำถามถึงเกณฑ์พร้อมกัน
+    with SessionLocal() as session:
+        result = session.execute(
+            update(User).where(User.id == user_id, User.invite_sent.isnot(True)).values(invite_sent=True)
+        )
+        session.commit()
+    claimed = result.rowcount == 1
+    if claimed:
+        _sync_user(user_id)
+    return claimed
+
+
+@metrics.timed("sqlite_add_quota")
+def add_quota(user_id, name, added_quota, slip_file, record=None):
+    # record (เช่น SlipHash ของสลิปที่จ่าย) ถูกบันทึกใน transaction เดียวกับการเพิ่มสิทธิ์
+    # ถ้า record ซ้ำ (unique) จะไม่เพิ่มสิทธิ์และคืน None ถ้าเพิ่มสิทธิ์ล้มเหลว record ก็ไม่ถูกบันทึก
+    now = datetime.now()
+    stmt = _insert(User).values(
+        id=user_id, name=name, usage=0, paid_quota=FREE_QUOTA + added_quota, slip_file=slip_file, last_uploaded=now
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[User.id],
+        set_={
+            "name": func.coalesce(User.name, stmt.excluded.name),
+            "paid_quota": func.coalesce(User.paid_quota, 0) + added_quota,
+            "slip_file": slip_file,
+            "last_uploaded": now,
+        },
+    ).returning(User.paid_quota)
+    with SessionLocal() as session:
+        try:
+            if record is not None:
+                session.add(record)
+                session.flush()
+            new_quota = session.execute(stmt).scalar_one()
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+            return None
+    _sync_user(user_id)
+    return new_quota
+
+
+# === LOGS ===
+@metrics.timed("sqlite_add_log")
+def add_log(user_id, action, detail):
+    now = datetime.now()
+    with SessionLocal() as session:
+        session.add(Log(line_id=user_id, action=action, detail=detail, timestamp=now))
+        session.commit()
+    _start_writers()
+    if _log_writer:
+        _log_writer.write([now.isoformat(), user_id, action, detail])
+
+
+# === SHEET SYNC ===
+def _user_fields(user):
+    return {
+        "name": user.name or "",
+        "usage": user.usage or 0,
+        "paid_quota": user.paid_quota or 0,
+        "slip_file": user.slip_file or "",
+        "updated_at": user.last_uploaded.isoformat() if user.last_uploaded else "",
+        "invite_sent": "TRUE" if user.invite_sent else "",
+    }
+
+
+class _SheetMirror:
+    """Coalesces changed user ids and mirrors them to the Users sheet.
+
+    Every ``interval`` seconds the latest rows of all changed users are read
+    from SQLite and written with one ``batch_update`` (plus one ``append_rows``
+    for users new to the sheet). Values always come from SQLite, so a retry or
+    a flush from another process can never write a stale counter.
+    """
+
+    def __init__(self, store, interval=SHEET_SYNC_INTERVAL):
+        self.store = store
+        self.interval = interval
+        self._dirty = set()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._seeded = False
+        self._thread = threading.Thread(target=self._run, name="sheet-sync", daemon=True)
+        self._thread.start()
+
+    def mark(self, user_id):
+        with self._cond:
+            self._dirty.add(user_id)
+
+    @property
+    def pending(self):
+        return len(self._dirty)
+
+    def _run(self):
+        # flush ครั้งแรกทันทีเพื่อ seed ก่อนมีผู้ใช้เขียนข้อมูลมากนัก
+        self.flush()
+        while not self._closed:
+            with self._cond:
+                self._cond.wait(self.interval)
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            # ห้ามเขียนทับ sheet จนกว่าจะดึงผู้ใช้เดิมคืนเข้า SQLite ที่เพิ่งสร้างใหม่สำเร็จ
+            if not self._seeded:
+                try:
+                    seed_users(self.store.records())
+                except Exception as e:
+                    print("⚠️ seed users from sheet error (sheet sync paused):", e)
+                    return False
+                self._seeded = True
+            with self._cond:
+                user_ids, self._dirty = self._dirty, set()
+            if not user_ids:
+                return True
+            try:
+                with SessionLocal() as session:
+                    users = session.query(User).filter(User.id.in_(user_ids)).all()
+                self.store.upsert_many({user.id: _user_fields(user) for user in users})
+            except Exception as e:
+                # เก็บไว้ลองใหม่รอบหน้า (ค่าที่เขียนอ่านจาก SQLite ใหม่ทุกครั้ง)
+                with self._cond:
+                    self._dirty |= user_ids
+                print(f"⚠️ sheet sync error ({len(user_ids)} users pending):", e)
+                return False
+            return True
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        with self._cond:
+            self._cond.notify()
+        self._thread.join(self.interval)
+        self.flush()
+
+
+def _sync_user(user_id):
+    _start_writers()
+    if _mirror:
+        _mirror.mark(user_id)
+
+
+# === IMPORT ===
+def _sheet_user(row):
+    user_id = str(row.get("user_id", "")).strip()
+    if not user_id:
+        return None
+    try:
+        updated_at = datetime.fromisoformat(str(row.get("updated_at") or "").strip())
+    except ValueError:
+        updated_at = None
+    return {
+        "id": user_id,
+        "name": row.get("name") or None,
+        "usage": int(row.get("usage") or row.get("question_count") or 0),
+        "paid_quota": int(row.get("paid_quota") or 0),
+        "slip_file": row.get("slip_file") or None,
+        "last_uploaded": updated_at,
+        "invite_sent": str(row.get("invite_sent", "")).lower().strip() == "true",
+    }
+
+
+def seed_users(rows):
+    """Restore users from Users sheet ``rows`` into a freshly created database.
+
+    Runs once per database: db_setup marks a new, empty database as pending
+    and the first process to get here flips it to done in the same
+    transaction, so concurrent workers never import twice. Rows written
+    since the restart only hold what happened after it, so their counters
+    are added on top of the sheet values instead of replacing them.
+    Returns the number of users restored.
+    """
+    users = [user for user in map(_sheet_user, rows) if user]
+    with SessionLocal() as session:
+        claimed = session.execute(
+            update(SyncState).where(SyncState.key == "users_seed", SyncState.value == "pending")
+            .values(value="done", updated_at=datetime.utcnow())
+        ).rowcount == 1
+        if not claimed:
+            return 0
+        for user in users:
+            stmt = _insert(User).values(**user)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[User.id],
+                set_={
+                    "name": func.coalesce(User.name, stmt.excluded.name),
+                    "usage": stmt.excluded.usage + func.coalesce(User.usage, 0),
+                    # แถวใหม่ทุกแถวเริ่มจาก FREE_QUOTA จึงนับเฉพาะส่วนที่เพิ่มหลังจากนั้น
+                    "paid_quota": stmt.excluded.paid_quota + func.coalesce(User.paid_quota, FREE_QUOTA) - FREE_QUOTA,
+                    "slip_file": func.coalesce(User.slip_file, stmt.excluded.slip_file),
+                    "last_uploaded": func.coalesce(User.last_uploaded, stmt.excluded.last_uploaded),
+                    "invite_sent": func.coalesce(User.invite_sent, False) | stmt.excluded.invite_sent,
+                },
+            )
+            session.execute(stmt)
+        session.commit()
+    if users:
+        print(f"✅ ดึงผู้ใช้ {len(users)} รายคืนจาก Users sheet")
+    return len(users)
+
+
+def import_from_sheets(users_sheet, logs_sheet=None):
+    users = logs = 0
+    with SessionLocal() as session:
+        for row in users_sheet.get_all_records():
+            user = _sheet_user(row)
+            if user is None:
+                continue
+            session.merge(User(**user))
+            users += 1
+        session.merge(SyncState(key="users_seed", value="done", updated_at=datetime.utcnow()))
+
+        if logs_sheet is not None:
+            if session.query(Log).first() is not None:
+                print("⚠️ ตาราง logs มีข้อมูลอยู่แล้ว ข้ามการนำเข้า log")
+            else:
+                for values in logs_sheet.get_all_values()[1:]:
+                    timestamp, line_id, action, detail = (values + [""] * 4)[:4]
+                    try:
+                        timestamp = datetime.fromisoformat(timestamp)
+                    except ValueError:
+                        timestamp = None
+                    session.add(Log(line_id=line_id, action=action, detail=detail, timestamp=timestamp))
+                    logs += 1
+        session.commit()
+    return users, logs
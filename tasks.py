@@ -1,40 +1,75 @@
 from celery import Celery
-from utils import extract_payment_info, add_or_update_user, push_line_message, log_usage
-from PIL import Image
-import pytesseract
-import cv2
+from celery.signals import worker_process_init, worker_process_shutdown
+from utils import add_or_update_user, push_line_message, log_usage
+import metrics
+from slip_ocr import StageTimer, load_slip, ocr_image
+import slip_index
+import storage
 import os
 
 celery = Celery("tasks", broker="redis://localhost:6379/0")
 
+# Celery worker ไม่มี Flask จึงเปิด /metrics ของตัวเองเมื่อกำหนด METRICS_PORT
+# ตัวเลข slip_* ถูกบันทึกใน process ที่รันงาน (process ลูกของ prefork) จึงเปิดในแต่ละตัว
+# ลูกลำดับที่ i ใช้พอร์ต METRICS_PORT + i (pool solo ใช้ METRICS_PORT)
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+@worker_process_init.connect
+def _serve_metrics(**kwargs):
+    if METRICS_PORT:
+        from billiard.process import current_process
+        metrics.serve(int(METRICS_PORT) + (getattr(current_process(), "index", None) or 0))
+
+@worker_process_shutdown.connect
+def _flush_sheets(**kwargs):
+    # process ลูกของ Celery จบด้วย os._exit ไม่ผ่าน atexit จึงต้องส่งของที่ค้างลง Sheets เอง
+    storage.close()
+
 @celery.task
+@metrics.timed("slip_process")
 def process_slip_async(user_id, user_name, filepath):
     try:
-        img = cv2.imread(filepath)
-        if img is None:
-            raise ValueError("ไม่สามารถอ่านภาพจากไฟล์ได้")
+        timer = StageTimer()
+        data, img = load_slip(filepath)
+        timer.lap("decode")
 
-        h, w = img.shape[:2]
-        if w > 1000:
-            new_w = 1000
-            new_h = int(h * 1000 / w)
-            img = cv2.resize(img, (new_w, new_h))
-            cv2.imwrite(filepath, img)
+        # ✅ ไฟล์เดิม หรือสลิปที่มีเลขที่รายการ (จาก QR) เดิม รวมถึงภาพแคปหน้าจอ ตอบได้เลยไม่ต้อง OCR
+        sha256, ref = slip_index.slip_keys(data, img)
+        duplicate = slip_index.find(sha256, ref)
+        timer.lap("hash_lookup")
+        if duplicate:
+            push_line_message(user_id, f"⚠️ สลิปนี้เคยใช้เพิ่มสิทธิ์ไปแล้ว ({duplicate.amount} บาท) ไม่สามารถใช้ซ้ำได้")
+            log_usage(user_id, "แนบสลิปซ้ำ", f"ซ้ำกับ {duplicate.slip_file} | timings(ms): {timer.timings}")
+            return
 
-        ocr_text = pytesseract.image_to_string(Image.open(filepath), lang="eng+tha")
-        info = extract_payment_info(ocr_text)
+        # ✅ OCR ในหน่วยความจำ ไม่เขียนทับไฟล์สลิปต้นฉบับ
+        ocr_text, info, timings = ocr_image(img, timer)
 
         if not info["amount"]:
             push_line_message(user_id, "❌ ไม่พบจำนวนเงินในสลิป กรุณาแนบใหม่อีกครั้ง")
-            log_usage(user_id, "แนบสลิปล้มเหลว", f"OCR: {ocr_text}")
+            log_usage(user_id, "แนบสลิปล้มเหลว", f"OCR: {ocr_text} | timings(ms): {timings}")
             return
 
+        # อ่าน QR ไม่ได้: ใช้เลขที่รายการจาก OCR แทน
+        if ref is None and info["ref"]:
+            ref = info["ref"]
+            duplicate = slip_index.find(ref=ref)
+            if duplicate:
+                push_line_message(user_id, f"⚠️ สลิปนี้เคยใช้เพิ่มสิทธิ์ไปแล้ว ({duplicate.amount} บาท) ไม่สามารถใช้ซ้ำได้")
+                log_usage(user_id, "แนบสลิปซ้ำ", f"ซ้ำกับ {duplicate.slip_file} | OCR: {info}")
+                return
+
+        # บันทึกสลิปลง index พร้อมเพิ่มสิทธิ์ใน transaction เดียว: ถ้าเพิ่มสิทธิ์ล้มเหลว ส่งสลิปเดิมใหม่ได้
+        slip_file = os.path.basename(filepath)
         amount_paid = int(float(info["amount"]))
-        add_or_update_user(user_id, user_name, amount_paid, os.path.basename(filepath))
+        record = slip_index.entry(sha256, ref, info["amount"], info["name"], user_id, slip_file)
+        if add_or_update_user(user_id, user_name, amount_paid, slip_file, record) is None:
+            push_line_message(user_id, "⚠️ สลิปนี้เคยใช้เพิ่มสิทธิ์ไปแล้ว ไม่สามารถใช้ซ้ำได้")
+            log_usage(user_id, "แนบสลิปซ้ำ", f"OCR: {info}")
+            return
         push_line_message(user_id, f"📥 ได้รับสลิปแล้ว เพิ่มสิทธิ์ {amount_paid} ครั้งเรียบร้อย ✅")
-        log_usage(user_id, "แนบสลิป", f"OCR: {info}")
+        log_usage(user_id, "แนบสลิป", f"OCR: {info} | timings(ms): {timings}")
 
     except Exception as e:
         push_line_message(user_id, f"❌ ระบบขัดข้อง: {str(e)}")
         log_usage(user_id, "แนบสลิปล้มเหลว", f"Error: {str(e)}")
-
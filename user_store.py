@@ -0,0 +1,134 @@
+import os
+import re
+import threading
+import time
+
+from gspread.utils import rowcol_to_a1
+
+import metrics
+
+# === CONFIG ===
+# โหลดทั้งชีตใหม่เป็นระยะ เผื่อมีการแก้ไข/ลบแถวด้วยมือ
+FULL_RELOAD_INTERVAL = float(os.getenv("USER_STORE_RELOAD", 3600))
+
+_UPDATED_ROW = re.compile(r"![A-Z]+(\d+)")
+
+
+class UserStore:
+    """Process-local index over the Users sheet keyed by ``user_id``.
+
+    The sheet is downloaded once to map users to row numbers; rows appended
+    by other processes are picked up by fetching only the tail of the sheet,
+    and ``upsert_many`` writes every changed user in at most two calls.
+    """
+
+    def __init__(self, sheet, key="user_id"):
+        self.sheet = sheet
+        self.key = key
+        self._lock = threading.RLock()
+        self._header = []
+        self._rows = {}
+        self._row_numbers = {}
+        self._last_row = 1
+        self._loaded_at = 0
+        self._missing_columns = set()
+
+    # === LOAD / REFRESH ===
+    def _load(self):
+        with metrics.timed("sheets_load"):
+            values = self.sheet.get_all_values()
+        self._header = values[0] if values else []
+        self._rows.clear()
+        self._row_numbers.clear()
+        self._last_row = 1
+        self._index(values[1:], start=2)
+        self._loaded_at = time.time()
+
+    def _index(self, values, start):
+        for i, raw in enumerate(values, start=start):
+            self._last_row = i
+            row = dict(zip(self._header, raw))
+            user_id = row.get(self.key)
+            if user_id:
+                self._rows[user_id] = row
+                self._row_numbers[user_id] = i
+
+    def _refresh_tail(self):
+        last_col = rowcol_to_a1(1, max(len(self._header), 1)).rstrip("0123456789")
+        with metrics.timed("sheets_refresh"):
+            values = self.sheet.get(f"A{self._last_row + 1}:{last_col}")
+        self._index(values, start=self._last_row + 1)
+
+    def _ensure_loaded(self):
+        if not self._loaded_at or time.time() - self._loaded_at > FULL_RELOAD_INTERVAL:
+            self._load()
+
+    # === READ ===
+    def records(self):
+        # ทุกแถวในชีต (ใช้ตอนดึงผู้ใช้คืนเข้า SQLite ที่เพิ่งสร้างใหม่)
+        with self._lock:
+            self._ensure_loaded()
+            return [dict(row) for row in self._rows.values()]
+
+    # === WRITE ===
+    def _cells(self, row_number, fields):
+        cells = []
+        for name, value in fields.items():
+            if name not in self._header:
+                # เตือนครั้งเดียวต่อคอลัมน์ ไม่ใช่ทุกครั้งที่เขียน
+                if name not in self._missing_columns:
+                    self._missing_columns.add(name)
+                    print(f"⚠️ Users sheet ไม่มีคอลัมน์ {name}")
+                continue
+            col = self._header.index(name) + 1
+            cells.append({"range": rowcol_to_a1(row_number, col), "values": [[value]]})
+        return cells
+
+    def update_many(self, rows):
+        # ทุกเซลล์ของทุก user ในคำขอ batch_update เดียว
+        with self._lock:
+            self._ensure_loaded()
+            cells = []
+            for user_id, fields in rows.items():
+                row_number = self._row_numbers.get(user_id)
+                if row_number is None:
+                    raise KeyError(user_id)
+                cells.extend(self._cells(row_number, fields))
+            if cells:
+                with metrics.timed("sheets_update"):
+                    self.sheet.batch_update(cells, value_input_option="USER_ENTERED")
+            for user_id, fields in rows.items():
+                self._rows[user_id].update({k: str(v) for k, v in fields.items()})
+
+    def append_many(self, rows):
+        with self._lock:
+            self._ensure_loaded()
+            values = []
+            for user_id, fields in rows.items():
+                fields = dict(fields, **{self.key: user_id})
+                values.append([fields.get(name, "") for name in self._header])
+            with metrics.timed("sheets_append"):
+                response = self.sheet.append_rows(values)
+            match = _UPDATED_ROW.search(response.get("updates", {}).get("updatedRange", ""))
+            first_row = int(match.group(1)) if match else self._last_row + 1
+            for row_number, (user_id, row) in enumerate(zip(rows, values), start=first_row):
+                self._rows[user_id] = {name: str(v) for name, v in zip(self._header, row)}
+                self._row_numbers[user_id] = row_number
+            self._last_row = max(self._last_row, first_row + len(values) - 1)
+
+    def upsert_many(self, rows):
+        """Update users that already have a row and append the rest, two calls at most.
+
+        The sheet tail is re-read first so users appended by another process
+        (another gunicorn worker, the Celery worker) are updated, not duplicated.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            if any(user_id not in self._row_numbers for user_id in rows):
+                self._refresh_tail()
+            existing = {k: v for k, v in rows.items() if k in self._row_numbers}
+            new = {k: v for k, v in rows.items() if k not in self._row_numbers}
+            if existing:
+                self.update_many(existing)
+            if new:
+                self.append_many(new)